@@ -0,0 +1,441 @@
+__author__ = 'gwolf'
+__date__ = '2021-03-10'
+__copyright__ = '(C) 2021 by gwolf'
+
+__revision__ = '$Format:%H$'
+
+import csv
+import fnmatch
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Any, List, Tuple, Union
+
+from qgis.core import (QgsCoordinateTransformContext, QgsProcessingAlgorithm,
+                       QgsProcessingContext, QgsProcessingException, QgsProcessingFeedback,
+                       QgsProcessingOutputNumber,
+                       QgsProcessingParameterBoolean, QgsProcessingParameterDefinition, QgsProcessingParameterFile,
+                       QgsProcessingParameterFolderDestination, QgsProcessingParameterNumber,
+                       QgsProcessingParameterString)
+
+from ..main_alg.main_alg import Process, options as process_options
+from ...modules.optionParser import parseOptions
+
+options = parseOptions(__file__)
+
+# files a district layer may be read from
+VECTOR_EXTENSIONS = ('.gpkg', '.shp', '.geojson', '.json', '.fgb', '.sqlite', '.gml', '.kml', '.tab', '.parquet')
+
+# seconds between two checks of the cancel button while districts are running
+POLL_INTERVAL = 0.5
+
+REPORT_FILE = 'batch_report.json'
+
+
+def find_layer(directory: str, pattern: str) -> str:
+    for name in sorted(os.listdir(directory)):
+        if fnmatch.fnmatch(name.lower(), pattern.lower()) and os.path.splitext(name)[1].lower() in VECTOR_EXTENSIONS:
+            return os.path.join(directory, name)
+    return ''
+
+
+def folder_districts(folder: str, canals_pattern: str, points_pattern: str) -> List[Tuple[str, str, str]]:
+    """
+    Every sub-folder of ``folder`` is a district named after it, with the
+    canals and points layers matching the patterns (an empty path when no
+    file matches).
+    """
+    districts = []
+    for name in sorted(os.listdir(folder)):
+        directory = os.path.join(folder, name)
+        if os.path.isdir(directory):
+            districts.append((name, find_layer(directory, canals_pattern), find_layer(directory, points_pattern)))
+    return districts
+
+
+def listed_districts(path: str) -> List[Tuple[str, str, str]]:
+    """
+    Districts of a CSV file with district, canals and points columns; the
+    layer paths are relative to the file.
+    """
+    directory = os.path.dirname(path)
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        return [(row['district'], os.path.join(directory, row['canals']), os.path.join(directory, row['points']))
+                for row in csv.DictReader(file)]
+
+
+class DistrictFeedback(QgsProcessingFeedback):
+    """
+    Feedback of one district, forwarding its warnings and errors to the batch
+    feedback prefixed with the district name, and keeping the errors for the
+    report. The progress is left to the batch.
+    """
+
+    def __init__(self, district: str, batch_feedback: QgsProcessingFeedback) -> None:
+        super().__init__()
+        self.district = district
+        self.batch_feedback = batch_feedback
+        self.errors: List[str] = []
+
+    def reportError(self, error: str, fatalError: bool = False) -> None:
+        super().reportError(error, fatalError)
+        self.errors.append(error)
+        # a failed district does not stop the others
+        self.batch_feedback.reportError('{}: {}'.format(self.district, error), False)
+
+    def pushWarning(self, warning: str) -> None:
+        super().pushWarning(warning)
+        self.batch_feedback.pushWarning('{}: {}'.format(self.district, warning))
+
+
+def run_district(algorithm: QgsProcessingAlgorithm, parameters: Dict[str, Any],
+                 transform_context: QgsCoordinateTransformContext,
+                 feedback: QgsProcessingFeedback) -> Tuple[Dict[str, Any], float]:
+    """
+    Runs one district in its own context (contexts are bound to the thread
+    they are used in) and returns its results with its running time, which
+    leaves out the time the district waited for a free worker.
+    """
+    started = time.perf_counter()
+    context = QgsProcessingContext()
+    context.setTransformContext(transform_context)
+
+    results, ok = algorithm.run(parameters, context, feedback, {}, False)
+    if not ok:
+        raise QgsProcessingException('The algorithm did not finish')
+    return results, time.perf_counter() - started
+
+
+class BatchProcess(QgsProcessingAlgorithm):
+    INPUTFOLDER = 'INPUTFOLDER'
+    PAIRS = 'PAIRS'
+    CANALSPATTERN = 'CANALSPATTERN'
+    POINTSPATTERN = 'POINTSPATTERN'
+
+    CANALSFIELD = Process.CANALSFIELD
+    POINTSFIELD = Process.POINTSFIELD
+
+    TYPEFIELD = Process.TYPEFIELD
+    TYPEVALUE = Process.TYPEVALUE
+
+    TOLERANCECANALS = Process.TOLERANCECANALS
+    TOLERANCEPOINTS = Process.TOLERANCEPOINTS
+
+    DISTRICTS = 'DISTRICTS'
+    WORKERS = Process.WORKERS
+    DETERMINISTICUUIDS = Process.DETERMINISTICUUIDS
+    PROFILE = 'PROFILE'
+
+    OUTPUTFOLDER = 'OUTPUTFOLDER'
+
+    SUCCEEDED = 'SUCCEEDED'
+    FAILED = 'FAILED'
+
+    def __init__(self, plugin_dir: str) -> None:
+        self.__plugin_dir = plugin_dir
+
+        super().__init__()
+
+    def initAlgorithm(self, config: Dict[str, Any]) -> None:
+        self.addParameter(
+            QgsProcessingParameterFile(
+                name=self.INPUTFOLDER,
+                description='folder with a sub-folder per district',
+                behavior=QgsProcessingParameterFile.Folder,
+                optional=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFile(
+                name=self.PAIRS,
+                description='list of districts (CSV with district, canals and points columns)',
+                behavior=QgsProcessingParameterFile.File,
+                extension='csv',
+                optional=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterString(
+                name=self.CANALSPATTERN,
+                description='file name pattern of the lines in a district folder',
+                multiLine=False,
+                defaultValue=options.get(self.CANALSPATTERN, None)
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterString(
+                name=self.POINTSPATTERN,
+                description='file name pattern of the points in a district folder',
+                multiLine=False,
+                defaultValue=options.get(self.POINTSPATTERN, None)
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterString(
+                name=self.CANALSFIELD,
+                description='LINE NAME attribute (lines)',
+                multiLine=False,
+                defaultValue=process_options.get(self.CANALSFIELD, None)
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterString(
+                name=self.POINTSFIELD,
+                description='LINE NAME attribute (points)',
+                multiLine=False,
+                defaultValue=process_options.get(self.POINTSFIELD, None)
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterString(
+                name=self.TYPEFIELD,
+                description='TYPE attribute for points',
+                multiLine=False,
+                defaultValue=process_options.get(self.TYPEFIELD, None)
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterString(
+                name=self.TYPEVALUE,
+                description='type VALUE for intersection points',
+                multiLine=False,
+                defaultValue=process_options.get(self.TYPEVALUE, None)
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                name=self.TOLERANCECANALS,
+                description='snapping threshold for lines',
+                type=QgsProcessingParameterNumber.Double,
+                minValue=0,
+                defaultValue=process_options.get(self.TOLERANCECANALS, None)
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                name=self.TOLERANCEPOINTS,
+                description='snapping threshold for points',
+                type=QgsProcessingParameterNumber.Double,
+                minValue=0,
+                defaultValue=process_options.get(self.TOLERANCEPOINTS, None)
+            )
+        )
+
+        districts = QgsProcessingParameterNumber(
+            name=self.DISTRICTS,
+            description='districts processed at once (0 - all processor cores)',
+            type=QgsProcessingParameterNumber.Integer,
+            minValue=0,
+            defaultValue=options.get(self.DISTRICTS, 0)
+        )
+        districts.setFlags(districts.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(districts)
+
+        workers = QgsProcessingParameterNumber(
+            name=self.WORKERS,
+            description='snapping workers per district (0 - share the processor cores)',
+            type=QgsProcessingParameterNumber.Integer,
+            minValue=0,
+            defaultValue=0
+        )
+        workers.setFlags(workers.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(workers)
+
+        deterministic = QgsProcessingParameterBoolean(
+            name=self.DETERMINISTICUUIDS,
+            description='derive the uuids from the feature attributes and geometry',
+            defaultValue=process_options.get(self.DETERMINISTICUUIDS, False)
+        )
+        deterministic.setFlags(deterministic.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(deterministic)
+
+        profile = QgsProcessingParameterBoolean(
+            name=self.PROFILE,
+            description='profile every district and add its stage timings to the report (slower)',
+            defaultValue=options.get(self.PROFILE, False)
+        )
+        profile.setFlags(profile.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(profile)
+
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                name=self.OUTPUTFOLDER,
+                description='Output folder (a sub-folder per district)'
+            )
+        )
+
+        self.addOutput(QgsProcessingOutputNumber(self.SUCCEEDED, 'districts processed'))
+        self.addOutput(QgsProcessingOutputNumber(self.FAILED, 'districts failed'))
+
+    def processAlgorithm(self, parameters: Dict[str, Any],
+                         context: QgsProcessingContext,
+                         feedback: QgsProcessingFeedback) -> Union[dict, Dict[str, Any]]:
+        result = dict()
+
+        inputfolder: str = self.parameterAsFile(parameters, self.INPUTFOLDER, context)
+        pairs: str = self.parameterAsFile(parameters, self.PAIRS, context)
+        canalspattern: str = self.parameterAsString(parameters, self.CANALSPATTERN, context)
+        pointspattern: str = self.parameterAsString(parameters, self.POINTSPATTERN, context)
+
+        outputfolder: str = self.parameterAsString(parameters, self.OUTPUTFOLDER, context)
+        profile: bool = self.parameterAsBoolean(parameters, self.PROFILE, context)
+
+        cores = os.cpu_count() or 1
+        districtworkers: int = self.parameterAsInt(parameters, self.DISTRICTS, context) or cores
+        workers: int = self.parameterAsInt(parameters, self.WORKERS, context) or max(1, cores // districtworkers)
+
+        districts = []
+        if inputfolder:
+            districts.extend(folder_districts(inputfolder, canalspattern, pointspattern))
+        if pairs:
+            districts.extend(listed_districts(pairs))
+        if not districts:
+            raise QgsProcessingException('No districts found, set a district folder or a list of districts')
+
+        # options shared by every district
+        shared = {
+            self.CANALSFIELD: self.parameterAsString(parameters, self.CANALSFIELD, context),
+            self.POINTSFIELD: self.parameterAsString(parameters, self.POINTSFIELD, context),
+            self.TYPEFIELD: self.parameterAsString(parameters, self.TYPEFIELD, context),
+            self.TYPEVALUE: self.parameterAsString(parameters, self.TYPEVALUE, context),
+            self.TOLERANCECANALS: self.parameterAsDouble(parameters, self.TOLERANCECANALS, context),
+            self.TOLERANCEPOINTS: self.parameterAsDouble(parameters, self.TOLERANCEPOINTS, context),
+            self.DETERMINISTICUUIDS: self.parameterAsBoolean(parameters, self.DETERMINISTICUUIDS, context),
+            self.WORKERS: workers,
+        }
+
+        os.makedirs(outputfolder, exist_ok=True)
+        process = Process(self.__plugin_dir)
+
+        report = []
+        jobs: Dict[Future, Tuple[Dict[str, Any], DistrictFeedback]] = {}
+
+        with ThreadPoolExecutor(max_workers=districtworkers) as executor:
+            for district, canals, points in districts:
+                entry = {'district': district, 'canals': canals, 'points': points}
+                report.append(entry)
+                if not canals or not points:
+                    entry['error'] = 'lines or points layer not found'
+                    feedback.reportError('{}: {}'.format(district, entry['error']))
+                    continue
+
+                directory = os.path.join(outputfolder, district)
+                os.makedirs(directory, exist_ok=True)
+
+                district_parameters = dict(shared, **{
+                    Process.CANALS: canals,
+                    Process.DELIVERYPOINTS: points,
+                    Process.POINTSWITHUUID: os.path.join(directory, 'points_with_uuid.gpkg'),
+                    Process.SNAPPEDPOINTS: os.path.join(directory, 'snapped_points.gpkg'),
+                    Process.SNAPPEDCANALS: os.path.join(directory, 'snapped_canals.gpkg'),
+                })
+                # a profile turns on the per feature timing, which slows the district down
+                if profile:
+                    district_parameters[Process.PROFILE] = os.path.join(directory, 'profile.json')
+
+                # one instance per district, sharing the loaded modules and options
+                algorithm = process.create()
+
+                district_feedback = DistrictFeedback(district, feedback)
+                job = executor.submit(run_district, algorithm, district_parameters, context.transformContext(),
+                                      district_feedback)
+                jobs[job] = (entry, district_feedback)
+
+            pending = set(jobs)
+            total = 100.0 / len(districts)
+            done = len(districts) - len(pending)
+
+            while pending:
+                finished, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+
+                if feedback.isCanceled():
+                    for job in pending:
+                        job.cancel()
+                        jobs[job][1].cancel()
+
+                for job in finished:
+                    entry, district_feedback = jobs[job]
+                    done += 1
+                    feedback.setProgress(done * total)
+
+                    if job.cancelled():
+                        entry['error'] = 'canceled'
+                        continue
+
+                    try:
+                        entry['outputs'], entry['seconds'] = job.result()
+                    except Exception as error:
+                        # the errors the algorithm reported already reached the batch feedback
+                        entry['error'] = '\n'.join(district_feedback.errors) or str(error)
+                        if not district_feedback.errors:
+                            feedback.reportError('{}: {}'.format(entry['district'], error))
+                        continue
+
+                    profilefile = entry['outputs'].get(Process.PROFILE)
+                    if profilefile and os.path.exists(profilefile):
+                        with open(profilefile, encoding='utf-8') as file:
+                            entry['stages'] = json.load(file)['stages']
+
+                    feedback.pushInfo('{}: {:.3f} s'.format(entry['district'], entry['seconds']))
+
+        with open(os.path.join(outputfolder, REPORT_FILE), 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2, default=str)
+
+        failed = sum('error' in entry for entry in report)
+        if failed:
+            feedback.reportError('{} of {} districts failed, see {}'.format(failed, len(report), REPORT_FILE))
+
+        result.update({
+            self.OUTPUTFOLDER: outputfolder,
+            self.SUCCEEDED: len(report) - failed,
+            self.FAILED: failed,
+        })
+
+        return result
+
+    def name(self) -> str:
+        """
+        Returns the algorithm name, used for identifying the algorithm. This
+        string should be fixed for the algorithm, and must not be localised.
+        The name should be unique within each provider. Names should contain
+        lowercase alphanumeric characters only and no spaces or other
+        formatting characters.
+        """
+        return 'batch_process_data'
+
+    def displayName(self) -> str:
+        """
+        Returns the translated algorithm name, which should be used for any
+        user-visible display of the algorithm name.
+        """
+        return self.name()
+
+    def group(self) -> str:
+        """
+        Returns the name of the group this algorithm belongs to. This string
+        should be localised.
+        """
+        return self.groupId()
+
+    def groupId(self) -> str:
+        """
+        Returns the unique ID of the group this algorithm belongs to. This
+        string should be fixed for the algorithm, and must not be localised.
+        The group id should be unique within each provider. Group id should
+        contain lowercase alphanumeric characters only and no spaces or other
+        formatting characters.
+        """
+        return 'process_data'
+
+    def createInstance(self) -> QgsProcessingAlgorithm:
+        return BatchProcess(self.__plugin_dir)
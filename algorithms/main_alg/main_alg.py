@@ -5,23 +5,40 @@ __copyright__ = '(C) 2021 by gwolf'
 __revision__ = '$Format:%H$'
 
 import os
-from typing import Dict, Any, Union
-
-import processing
-from processing.modeler.ModelerDialog import ModelerDialog
+from itertools import chain
+from typing import Dict, Any, List, Union
 
 from qgis.core import (QgsProcessing,
                        QgsProcessingAlgorithm, QgsProcessingParameterField,
                        QgsProcessingParameterFeatureSource, QgsProcessingParameterFeatureSink, QgsProcessingContext,
                        QgsProcessingFeedback, QgsProcessingParameterString,
-                       QgsProcessingParameterDistance, QgsProcessingMultiStepFeedback, QgsExpression,
-                       QgsFeatureRequest, QgsVectorLayer)
-
+                       QgsProcessingParameterDistance, QgsProcessingParameterNumber,
+                       QgsProcessingParameterDefinition, QgsProcessingParameterFileDestination,
+                       QgsProcessingParameterFolderDestination,
+                       QgsProcessingParameterFile, QgsProcessingParameterBoolean,
+                       QgsProcessingMultiStepFeedback, QgsProcessingUtils,
+                       QgsCoordinateTransform, QgsWkbTypes)
+
+from ...modules.cache import CANALS_LAYER, INTERSECTIONS_LAYER, StageCache, stage_key
+from ...modules.grouping import group_key, group_order, index_features, snap_point_groups
+from ...modules.merging import conform, conformed, merge_fields, merge_wkb_type
 from ...modules.optionParser import parseOptions
-from ...widgets.field_widget import CustomFieldWrapper
+from ...modules.pipeline import (CONNECTED_RATIO, EXTENSION_RATIO, UUID_FIELD, build_network, content_uuid_assigner,
+                                 intersection_fields, tag_uuid, with_uuid_field)
+from ...modules.profiling import Profiler, profiled
+from ...modules.sinks import layer_options, write_features
+from ...modules.snapping import SegmentIndex
+from ...modules.state import StateStore
+from ...modules.store import FeatureStore
+from ...modules.tiling import SpillStore, process_canal_tiles, process_point_tiles
+from ...modules.topology import TopologyBuilder
 
 options = parseOptions(__file__)
 
+# resolved by the Processing dialogs only, so that the algorithm can be
+# created without importing the GUI wrappers (qgis_process, batch workers)
+FIELD_WIDGET_WRAPPER = '{}.widgets.field_widget.CustomFieldWrapper'.format(__package__.rsplit('.', 2)[0])
+
 
 class Process(QgsProcessingAlgorithm):
     CANALS = 'CANALS'
@@ -36,6 +53,19 @@ class Process(QgsProcessingAlgorithm):
     TOLERANCECANALS = 'TOLERANCECANALS'
     TOLERANCEPOINTS = 'TOLERANCEPOINTS'
 
+    WORKERS = 'WORKERS'
+    BATCHSIZE = 'BATCHSIZE'
+    DETERMINISTICUUIDS = 'DETERMINISTICUUIDS'
+    STATE = 'STATE'
+    TILESIZE = 'TILESIZE'
+    SPILLDIR = 'SPILLDIR'
+    PROFILE = 'PROFILE'
+    TOPOLOGY = 'TOPOLOGY'
+    CACHEDIR = 'CACHEDIR'
+    CACHESIZE = 'CACHESIZE'
+    BYPASSCACHE = 'BYPASSCACHE'
+    SPATIALORDER = 'SPATIALORDER'
+
     POINTSWITHUUID = 'POINTSWITHUUID'
     SNAPPEDPOINTS = 'SNAPPEDPOINTS'
     SNAPPEDCANALS = 'SNAPPEDCANALS'
@@ -43,9 +73,6 @@ class Process(QgsProcessingAlgorithm):
     def __init__(self, plugin_dir: str) -> None:
         self.__plugin_dir = plugin_dir
 
-        self.snap_lines = ModelerDialog()
-        self.snap_lines.loadModel(os.path.join(self.__plugin_dir, r"qgis_models", "snap_lines.model3"))
-
         super().__init__()
 
     def initAlgorithm(self, config: Dict[str, Any]) -> None:
@@ -79,7 +106,7 @@ class Process(QgsProcessingAlgorithm):
         )
 
         self.parameterDefinition(self.CANALSFIELD).setMetadata({
-            'widget_wrapper': CustomFieldWrapper
+            'widget_wrapper': FIELD_WIDGET_WRAPPER
         })
 
         self.addParameter(
@@ -94,7 +121,7 @@ class Process(QgsProcessingAlgorithm):
         )
 
         self.parameterDefinition(self.POINTSFIELD).setMetadata({
-            'widget_wrapper': CustomFieldWrapper
+            'widget_wrapper': FIELD_WIDGET_WRAPPER
         })
 
         self.addParameter(
@@ -109,7 +136,7 @@ class Process(QgsProcessingAlgorithm):
         )
 
         self.parameterDefinition(self.TYPEFIELD).setMetadata({
-            'widget_wrapper': CustomFieldWrapper
+            'widget_wrapper': FIELD_WIDGET_WRAPPER
         })
 
         self.addParameter(
@@ -140,6 +167,117 @@ class Process(QgsProcessingAlgorithm):
             )
         )
 
+        workers = QgsProcessingParameterNumber(
+            name=self.WORKERS,
+            description='number of snapping workers (0 - all processor cores)',
+            type=QgsProcessingParameterNumber.Integer,
+            minValue=0,
+            defaultValue=options.get(self.WORKERS, 0)
+        )
+        workers.setFlags(workers.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(workers)
+
+        batchsize = QgsProcessingParameterNumber(
+            name=self.BATCHSIZE,
+            description='features per output write batch',
+            type=QgsProcessingParameterNumber.Integer,
+            minValue=1,
+            defaultValue=options.get(self.BATCHSIZE, 10000)
+        )
+        batchsize.setFlags(batchsize.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(batchsize)
+
+        deterministic = QgsProcessingParameterBoolean(
+            name=self.DETERMINISTICUUIDS,
+            description='derive the uuids from the feature attributes and geometry',
+            defaultValue=options.get(self.DETERMINISTICUUIDS, False)
+        )
+        deterministic.setFlags(deterministic.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(deterministic)
+
+        state = QgsProcessingParameterFileDestination(
+            name=self.STATE,
+            description='incremental state store (reuses uuids and unchanged groups)',
+            fileFilter='SQLite state (*.sqlite)',
+            optional=True,
+            createByDefault=False
+        )
+        state.setFlags(state.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(state)
+
+        tilesize = QgsProcessingParameterDistance(
+            name=self.TILESIZE,
+            description='tile size for tiled processing (0 - process the whole extent at once)',
+            parentParameterName=self.CANALS,
+            minValue=0,
+            defaultValue=options.get(self.TILESIZE, 0)
+        )
+        tilesize.setFlags(tilesize.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(tilesize)
+
+        spilldir = QgsProcessingParameterFile(
+            name=self.SPILLDIR,
+            description='spill directory for tiled processing (default - temporary folder)',
+            behavior=QgsProcessingParameterFile.Folder,
+            optional=True
+        )
+        spilldir.setFlags(spilldir.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(spilldir)
+
+        profile = QgsProcessingParameterFileDestination(
+            name=self.PROFILE,
+            description='per stage timing report',
+            fileFilter='JSON (*.json);;CSV (*.csv)',
+            optional=True,
+            createByDefault=False
+        )
+        profile.setFlags(profile.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(profile)
+
+        topology = QgsProcessingParameterFolderDestination(
+            name=self.TOPOLOGY,
+            description='network topology folder (memory-mappable .npy arrays of nodes, CSR edges, points)',
+            optional=True,
+            createByDefault=False
+        )
+        topology.setFlags(topology.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(topology)
+
+        cachedir = QgsProcessingParameterFile(
+            name=self.CACHEDIR,
+            description='cache folder for the line results across runs (default - no cache)',
+            behavior=QgsProcessingParameterFile.Folder,
+            optional=True
+        )
+        cachedir.setFlags(cachedir.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cachedir)
+
+        cachesize = QgsProcessingParameterNumber(
+            name=self.CACHESIZE,
+            description='cache size limit, MB',
+            type=QgsProcessingParameterNumber.Integer,
+            minValue=0,
+            defaultValue=options.get(self.CACHESIZE, 1024)
+        )
+        cachesize.setFlags(cachesize.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cachesize)
+
+        bypasscache = QgsProcessingParameterBoolean(
+            name=self.BYPASSCACHE,
+            description='recompute the line results instead of reusing the cached ones',
+            defaultValue=False
+        )
+        bypasscache.setFlags(bypasscache.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(bypasscache)
+
+        spatialorder = QgsProcessingParameterBoolean(
+            name=self.SPATIALORDER,
+            description='write the outputs sorted by line name and along a Hilbert curve',
+            defaultValue=options.get(self.SPATIALORDER, False)
+        )
+        spatialorder.setFlags(spatialorder.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(spatialorder)
+
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 name=self.POINTSWITHUUID,
@@ -185,135 +323,269 @@ class Process(QgsProcessingAlgorithm):
         tolerancepoints: float = self.parameterAsDouble(parameters, self.TOLERANCEPOINTS, context)
         tolerancecanals: float = self.parameterAsDouble(parameters, self.TOLERANCECANALS, context)
 
-        model_feedback = QgsProcessingMultiStepFeedback(3, feedback)
-
-        if feedback.isCanceled():
-            return result
-
-        snappedcanals_out_name = 'native:splitwithlines_1:{}'.format(self.SNAPPEDCANALS)
-        intersect_out_name = 'native:fieldcalculator_1:INTERSECTIONS'
-        points_with_uuid_name = 'qgis:advancedpythonfieldcalculator_1:{}'.format(self.POINTSWITHUUID)
-
-        proc_result = processing.run(self.snap_lines.model(),
-                                     {
-                                         'CANALS': parameters[self.CANALS],
-                                         'DELIVERYPOINTS': parameters[self.DELIVERYPOINTS],
-                                         'TOLERANCECANALS': tolerancecanals,
-                                         'TYPEFIELD': typefield,
-                                         'TYPEVALUE': typevalue,
-                                         'VERBOSE_LOG': True,
-                                         snappedcanals_out_name: 'TEMPORARY_OUTPUT',
-                                         intersect_out_name: 'TEMPORARY_OUTPUT',
-                                         points_with_uuid_name: 'TEMPORARY_OUTPUT',
-                                     },
-                                     context=context,
-                                     feedback=model_feedback,
-                                     is_child_algorithm=True)
-        # TODO SNAPPEDCANALS добавить в result в конце, когда они будут порезаны по пересечениям
-
-        print("Main processing complete")
-
-        model_feedback.setCurrentStep(1)
-
-        if feedback.isCanceled():
-            return result
+        workers: int = self.parameterAsInt(parameters, self.WORKERS, context) or os.cpu_count() or 1
+        batchsize: int = self.parameterAsInt(parameters, self.BATCHSIZE, context)
+        deterministic: bool = self.parameterAsBoolean(parameters, self.DETERMINISTICUUIDS, context)
 
-        snapped_canals: QgsVectorLayer = context.takeResultLayer(
-            proc_result[snappedcanals_out_name])
+        statefile: str = self.parameterAsFileOutput(parameters, self.STATE, context)
 
-        intersections: QgsVectorLayer = context.takeResultLayer(
-            proc_result[intersect_out_name])
+        tilesize: float = self.parameterAsDouble(parameters, self.TILESIZE, context)
+        spilldir: str = self.parameterAsFile(parameters, self.SPILLDIR, context)
 
-        points_with_uuid: QgsVectorLayer = context.takeResultLayer(
-            proc_result[points_with_uuid_name])
+        profilefile: str = self.parameterAsFileOutput(parameters, self.PROFILE, context)
+        # per feature timing of the streaming stages only when a report is asked for
+        profiler = Profiler(streams=bool(profilefile))
 
-        (snapped_canals_sink, snapped_canals_id) = self.parameterAsSink(parameters, self.SNAPPEDCANALS,
-                                                                        context, snapped_canals.fields(),
-                                                                        snapped_canals.wkbType(),
-                                                                        snapped_canals.sourceCrs())
-
-        (points_with_uuid_sink, points_with_uuid_id) = self.parameterAsSink(parameters, self.POINTSWITHUUID,
-                                                                            context, points_with_uuid.fields(),
-                                                                            points_with_uuid.wkbType(),
-                                                                            points_with_uuid.sourceCrs())
+        topologydir: str = self.parameterAsFileOutput(parameters, self.TOPOLOGY, context)
 
-        snapped_canals_sink.addFeatures(snapped_canals.getFeatures())
-        points_with_uuid_sink.addFeatures(points_with_uuid.getFeatures())
+        cachedir: str = self.parameterAsFile(parameters, self.CACHEDIR, context)
+        cachesize: int = self.parameterAsInt(parameters, self.CACHESIZE, context)
+        bypasscache: bool = self.parameterAsBoolean(parameters, self.BYPASSCACHE, context)
+        spatialorder: bool = self.parameterAsBoolean(parameters, self.SPATIALORDER, context)
 
-        result.update({
-            self.SNAPPEDCANALS: snapped_canals_id,
-            self.POINTSWITHUUID: points_with_uuid_id,
-        })
-
-        snapped_points_layers = []
-
-        for line_name in points_with_uuid.uniqueValues(points_with_uuid.fields().indexFromName(pointsfield)):
-            line_expression = QgsExpression().createFieldEqualityExpression(canalsfield, line_name)
-            line_request = QgsFeatureRequest()
-            line_request.setFilterExpression(line_expression)
-
-            point_expression = QgsExpression().createFieldEqualityExpression(pointsfield, line_name)
-            point_request = QgsFeatureRequest()
-            point_request.setFilterExpression(point_expression)
-
-            subset_snapped_canals = snapped_canals.materialize(line_request, model_feedback)
-            subset_points_with_uuid = points_with_uuid.materialize(point_request, model_feedback)
-
-            snapped_points_layers.append(
-                processing.run("native:snapgeometries",
-                               {
-                                   'INPUT': subset_points_with_uuid,
-                                   'REFERENCE_LAYER': subset_snapped_canals,
-                                   'TOLERANCE': tolerancepoints,
-                                   'BEHAVIOR': 1,
-                                   'OUTPUT': 'TEMPORARY_OUTPUT'
-                               },
-                               context=context,
-                               # feedback=model_feedback,
-                               is_child_algorithm=True)['OUTPUT']
-            )
-
-        print("Cycle complete")
-
-        model_feedback.setCurrentStep(2)
+        model_feedback = QgsProcessingMultiStepFeedback(3, feedback)
 
         if feedback.isCanceled():
             return result
 
-        snapped_points_layers.append(intersections)
+        canals = self.parameterAsSource(parameters, self.CANALS, context)
+        points = self.parameterAsSource(parameters, self.DELIVERYPOINTS, context)
 
-        snapped_points_id = processing.run("native:mergevectorlayers",
-                                           {
-                                               'LAYERS': snapped_points_layers,
-                                               'CRS': points_with_uuid.crs(),
-                                               'OUTPUT': 'TEMPORARY_OUTPUT'
-                                           },
-                                           context=context,
-                                           feedback=model_feedback,
-                                           is_child_algorithm=True)['OUTPUT']
+        canals_fields = with_uuid_field(canals.fields())
+        points_fields = with_uuid_field(points.fields())
+        crossing_fields = intersection_fields(canals_fields, canalsfield, typefield)
 
-        snapped_points: QgsVectorLayer = context.takeResultLayer(snapped_points_id)
+        # the lines meet the points in the points CRS: snapping, topology and intersections
+        lines_transform = QgsCoordinateTransform(canals.sourceCrs(), points.sourceCrs(), context.transformContext())
 
-        (snapped_points_sink, snapped_points_id) = self.parameterAsSink(parameters, self.SNAPPEDPOINTS,
-                                                                        context, snapped_points.fields(),
-                                                                        snapped_points.wkbType(),
-                                                                        snapped_points.sourceCrs())
+        topology = TopologyBuilder(canals_fields.indexFromName(canalsfield), canals_fields.indexFromName(UUID_FIELD),
+                                   points_fields.indexFromName(pointsfield), points_fields.indexFromName(UUID_FIELD),
+                                   tolerancepoints, tolerancecanals * EXTENSION_RATIO * CONNECTED_RATIO,
+                                   lines_transform, group_key) \
+            if topologydir else None
 
-        snapped_points_sink.addFeatures(snapped_points.getFeatures())
+        # FlatGeobuf and GeoParquet destinations get their spatial index / row group options
+        def output_options(name: str) -> List[str]:
+            return layer_options(self.parameterAsOutputLayer(parameters, name, context), batchsize)
 
-        print("Vectors merged")
+        (snapped_canals_sink, snapped_canals_id) = self.parameterAsSink(parameters, self.SNAPPEDCANALS,
+                                                                        context, canals_fields,
+                                                                        QgsWkbTypes.multiType(canals.wkbType()),
+                                                                        canals.sourceCrs(),
+                                                                        layerOptions=output_options(self.SNAPPEDCANALS))
 
-        model_feedback.setCurrentStep(3)
+        (points_with_uuid_sink, points_with_uuid_id) = self.parameterAsSink(parameters, self.POINTSWITHUUID,
+                                                                            context, points_fields,
+                                                                            points.wkbType(),
+                                                                            points.sourceCrs(),
+                                                                            layerOptions=output_options(
+                                                                                self.POINTSWITHUUID))
 
-        if feedback.isCanceled():
-            return result
+        # the schema native:mergevectorlayers gave the snapped points and intersections
+        snapped_points_fields = merge_fields(points_fields, crossing_fields)
+        snapped_points_type = merge_wkb_type(points.wkbType(), QgsWkbTypes.Point)
 
-        result.update({
-            self.SNAPPEDPOINTS: snapped_points_id,
-        })
+        (snapped_points_sink, snapped_points_id) = self.parameterAsSink(parameters, self.SNAPPEDPOINTS,
+                                                                        context, snapped_points_fields,
+                                                                        snapped_points_type,
+                                                                        points.sourceCrs(),
+                                                                        layerOptions=output_options(self.SNAPPEDPOINTS))
+
+        cached = None
+        cache_writer = None
+        spill = None
+        state = None
+        try:
+            state = StateStore(statefile) if statefile else None
+
+            # content derived uuids are stable by themselves, the state store only keeps random ones
+            if deterministic:
+                canals_assign = content_uuid_assigner()
+                points_assign = content_uuid_assigner()
+            else:
+                canals_assign = state.uuid_assigner(self.CANALS) if state else None
+                points_assign = state.uuid_assigner(self.DELIVERYPOINTS) if state else None
+
+            # the line results only depend on the lines and these parameters
+            if cachedir:
+                cache = StageCache(cachedir, cachesize * 2 ** 20, context.transformContext())
+                with profiler.stage('cache lookup'):
+                    cache_key = stage_key(canals, {
+                        self.CANALSFIELD: canalsfield,
+                        self.TYPEFIELD: typefield,
+                        self.TYPEVALUE: typevalue,
+                        self.TOLERANCECANALS: tolerancecanals,
+                        self.DETERMINISTICUUIDS: deterministic,
+                        self.TILESIZE: tilesize,
+                        self.SPATIALORDER: spatialorder,
+                    })
+                    cached = cache.get(cache_key) if not bypasscache else None
+
+                if cached is not None:
+                    feedback.pushInfo('Reusing the cached lines and intersections {}'.format(cached.path))
+                    if state is not None and not deterministic:
+                        state.keep_uuids(self.CANALS)
+                else:
+                    cache_writer = cache.writer(cache_key)
+                    cache_writer.create(CANALS_LAYER, canals_fields, QgsWkbTypes.multiType(canals.wkbType()),
+                                        canals.sourceCrs())
+                    cache_writer.create(INTERSECTIONS_LAYER, crossing_fields, QgsWkbTypes.Point, canals.sourceCrs())
+
+            if tilesize > 0:
+                spill = SpillStore(spilldir or QgsProcessingUtils.tempFolder(), context.transformContext())
+
+                if cached is not None:
+                    with profiler.stage('{} output'.format(self.SNAPPEDCANALS)) as record:
+                        record['features'] = write_features(snapped_canals_sink,
+                                                            cached.features(CANALS_LAYER, canals_fields), batchsize,
+                                                            model_feedback)
+                    lines = cached.layer(CANALS_LAYER)
+                    intersections = cached.layer(INTERSECTIONS_LAYER)
+                else:
+                    with profiler.stage('canal tiles'):
+                        process_canal_tiles(canals, canals_fields, tilesize, tolerancecanals + tolerancepoints,
+                                            tolerancecanals, spill, snapped_canals_sink, crossing_fields, canalsfield,
+                                            typefield, typevalue, batchsize, canals_assign, model_feedback)
+                    lines = spill.layer('canals')
+                    intersections = spill.layer('intersections')
+                    if cache_writer is not None:
+                        cache_writer.write(CANALS_LAYER, conformed(lines, canals_fields))
+
+                model_feedback.setCurrentStep(1)
+
+                if feedback.isCanceled():
+                    return result
+
+                with profiler.stage('point tiles'):
+                    process_point_tiles(points, points_fields, tilesize, tolerancepoints, lines,
+                                        canalsfield, pointsfield, spill, points_with_uuid_sink, batchsize, workers,
+                                        points_assign, state, model_feedback, spatialorder)
+
+                if topology is not None:
+                    for line in conformed(lines, canals_fields):
+                        topology.add_line(line)
+
+                grouped_points = conformed(spill.layer('points'), points_fields)
+                crossings = conformed(intersections, crossing_fields)
+            else:
+                if cached is not None:
+                    pieces = cached.features(CANALS_LAYER, canals_fields)
+                else:
+                    network = build_network(canals.getFeatures(), canals_fields, tolerancecanals, model_feedback,
+                                            canals_assign, profiler)
+                    pieces = profiled(profiler, 'line split',
+                                      network.split(model_feedback, canalsfield if spatialorder else None))
+                    if cache_writer is not None:
+                        pieces = cache_writer.tee(CANALS_LAYER, pieces)
+
+                lines_by_name = SegmentIndex(tolerancepoints)
+                if topology is not None:
+                    pieces = topology.lines(pieces)
+                with profiler.stage('{} output'.format(self.SNAPPEDCANALS)) as record:
+                    record['features'] = write_features(
+                        snapped_canals_sink,
+                        index_features(pieces, canals_fields.indexFromName(canalsfield), lines_by_name,
+                                       lines_transform),
+                        batchsize, model_feedback)
+
+                point_store = FeatureStore(points_fields, points.wkbType())
+                with profiler.stage('{} output'.format(self.POINTSWITHUUID)) as record:
+                    tagged = point_store.collect(profiled(profiler, 'point tagging',
+                                                          tag_uuid(points.getFeatures(), points_fields, points_assign)))
+                    if spatialorder:
+                        # the tagged points go out in the order of the snapped ones
+                        for _ in tagged:
+                            pass
+                        tagged = point_store.sorted_features(point_store.groups(
+                            points_fields.indexFromName(pointsfield), points_fields.indexFromName(UUID_FIELD),
+                            group_key, group_order, spatial=True))
+                    record['features'] = write_features(points_with_uuid_sink, tagged, batchsize, model_feedback)
+
+                model_feedback.setCurrentStep(1)
+
+                if feedback.isCanceled():
+                    return result
+
+                grouped_points = profiled(profiler, 'point snapping',
+                                          snap_point_groups(point_store, points_fields.indexFromName(pointsfield),
+                                                            lines_by_name,
+                                                            points_fields.indexFromName(UUID_FIELD), workers,
+                                                            model_feedback, state, profiler, spatialorder))
+                if cached is not None:
+                    crossings = cached.features(INTERSECTIONS_LAYER, crossing_fields)
+                else:
+                    crossings = profiled(profiler, 'crossings',
+                                         network.intersections(crossing_fields, canalsfield, typefield, typevalue,
+                                                               spatial=spatialorder))
+
+            if cache_writer is not None:
+                crossings = cache_writer.tee(INTERSECTIONS_LAYER, crossings)
+
+            result.update({
+                self.SNAPPEDCANALS: snapped_canals_id,
+                self.POINTSWITHUUID: points_with_uuid_id,
+            })
+
+            model_feedback.setCurrentStep(2)
+
+            if feedback.isCanceled():
+                return result
+
+            if topology is not None:
+                grouped_points = topology.points(grouped_points)
+
+            # the path of the input layer every merged feature comes from, as native:mergevectorlayers gave
+            points_layer = self.parameterAsVectorLayer(parameters, self.DELIVERYPOINTS, context)
+            canals_layer = self.parameterAsVectorLayer(parameters, self.CANALS, context)
+            points_path = points_layer.publicSource() if points_layer is not None else None
+            canals_path = canals_layer.publicSource() if canals_layer is not None else None
+
+            # every group goes to the sink as soon as it is snapped, followed by the intersections
+            snapped_points = chain(
+                conform(grouped_points, points_fields, snapped_points_fields, 'snapped_points', snapped_points_type,
+                        path=points_path),
+                conform(crossings, crossing_fields, snapped_points_fields, 'intersections', snapped_points_type,
+                        lines_transform, canals_path))
+
+            with profiler.stage('{} output'.format(self.SNAPPEDPOINTS)) as record:
+                record['features'] = write_features(snapped_points_sink, snapped_points, batchsize, model_feedback)
+
+            model_feedback.setCurrentStep(3)
+
+            if feedback.isCanceled():
+                return result
+
+            result.update({
+                self.SNAPPEDPOINTS: snapped_points_id,
+            })
+
+            if cache_writer is not None:
+                cache_writer.commit()
+
+            if topology is not None:
+                with profiler.stage('topology'):
+                    topology.save(topologydir)
+                result[self.TOPOLOGY] = topologydir
+
+            if state is not None:
+                state.commit()
+                result[self.STATE] = statefile
+
+            profiler.report(feedback)
+            if profilefile:
+                profiler.save(profilefile)
+                result[self.PROFILE] = profilefile
 
-        print(result)
-        return result
+            return result
+        finally:
+            # a canceled or failed run leaves no partial cache entry behind (no-op once committed)
+            if cache_writer is not None:
+                cache_writer.discard()
+            if spill is not None:
+                spill.remove()
+            # the state file of a canceled or failed run is not left open (no-op once committed)
+            if state is not None:
+                state.close()
 
     def name(self) -> str:
         """
@@ -0,0 +1,49 @@
+"""
+Headless QGIS bootstrap shared by the benchmark scripts.
+"""
+
+import importlib
+import os
+import sys
+from types import ModuleType
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_qgis():
+    """
+    Starts an offscreen QgsApplication with Processing initialized and
+    returns it.
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    from qgis.core import QgsApplication
+
+    app = QgsApplication([], False)
+    app.initQgis()
+
+    from processing.core.Processing import Processing
+    Processing.initialize()
+
+    return app
+
+
+def import_plugin(module: str) -> ModuleType:
+    """
+    Imports a module of the plugin package, e.g. ``snapper_provider``.
+    """
+    if os.path.dirname(PLUGIN_DIR) not in sys.path:
+        sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    return importlib.import_module('{}.{}'.format(os.path.basename(PLUGIN_DIR), module))
+
+
+def load_provider():
+    """
+    Registers the Snapper provider and returns it.
+    """
+    from qgis.PyQt.QtGui import QIcon
+    from qgis.core import QgsApplication
+
+    provider = import_plugin('snapper_provider').snapperProvider(QIcon(), PLUGIN_DIR)
+    QgsApplication.processingRegistry().addProvider(provider)
+    return provider
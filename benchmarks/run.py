@@ -0,0 +1,134 @@
+"""
+End-to-end benchmark of the Snapper algorithm on synthetic data, measured
+headless.
+
+    python benchmarks/run.py [--scales 10k 100k 1M] [--output results.json]
+
+Every scale generates a canal network and its delivery points (see
+synthetic.py), runs the algorithm with the profile output enabled and
+collects the time, feature count and peak RSS of every stage. The results
+are printed as JSON, or written to ``--output`` so that runs of two releases
+can be compared.
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from typing import Any, Dict
+
+from qgis_app import PLUGIN_DIR, load_provider, start_qgis
+from synthetic import NAME_FIELD, SCALES, TOLERANCE, TYPE_FIELD, generate
+
+
+def plugin_version() -> str:
+    with open(os.path.join(PLUGIN_DIR, 'metadata.txt'), encoding='utf-8') as file:
+        for line in file:
+            if line.startswith('version='):
+                return line.split('=', 1)[1].strip()
+    return ''
+
+
+def run_scale(provider_id: str, scale: str, args: argparse.Namespace, directory: str) -> Dict[str, Any]:
+    import processing
+    from qgis.core import QgsProcessingContext, QgsProcessingFeedback
+
+    options = dict(SCALES[scale], segments_per_line=args.segments_per_line,
+                   features_per_line=args.features_per_line, gap=args.gap, noise=args.noise,
+                   tolerance_canals=args.tolerance_canals, tolerance_points=args.tolerance_points,
+                   seed=args.seed)
+
+    started = time.perf_counter()
+    canals, points = generate(**options)
+    generation = time.perf_counter() - started
+
+    profile = os.path.join(directory, '{}.json'.format(scale))
+    parameters = {
+        'CANALS': canals,
+        'DELIVERYPOINTS': points,
+        'CANALSFIELD': NAME_FIELD,
+        'POINTSFIELD': NAME_FIELD,
+        'TYPEFIELD': TYPE_FIELD,
+        'TYPEVALUE': 'JN',
+        'TOLERANCECANALS': args.tolerance_canals,
+        'TOLERANCEPOINTS': args.tolerance_points,
+        'WORKERS': args.workers,
+        'TILESIZE': args.tile_size,
+        'PROFILE': profile,
+        'POINTSWITHUUID': 'TEMPORARY_OUTPUT',
+        'SNAPPEDPOINTS': 'TEMPORARY_OUTPUT',
+        'SNAPPEDCANALS': 'TEMPORARY_OUTPUT',
+    }
+
+    started = time.perf_counter()
+    processing.run('{}:process_data'.format(provider_id), parameters,
+                   context=QgsProcessingContext(), feedback=QgsProcessingFeedback())
+    total = time.perf_counter() - started
+
+    with open(profile, encoding='utf-8') as file:
+        stages = json.load(file)
+
+    groups = stages['groups']
+    return {
+        'scale': scale,
+        'options': options,
+        'canals': canals.featureCount(),
+        'points': points.featureCount(),
+        'generation_s': generation,
+        'total_s': total,
+        'stages': stages['stages'],
+        'groups': {
+            'count': len(groups),
+            'seconds': sum(group['seconds'] for group in groups),
+            'slowest_s': max((group['seconds'] for group in groups), default=0.0),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['10k', '100k'])
+    parser.add_argument('--segments-per-line', type=int, default=50)
+    parser.add_argument('--features-per-line', type=int, default=5)
+    parser.add_argument('--gap', type=float, default=0.5, help='near-miss gap, relative to the canals tolerance')
+    parser.add_argument('--noise', type=float, default=0.8, help='point offset, relative to the points tolerance')
+    parser.add_argument('--tolerance-canals', type=float, default=TOLERANCE)
+    parser.add_argument('--tolerance-points', type=float, default=TOLERANCE)
+    parser.add_argument('--workers', type=int, default=0, help='0 uses every CPU')
+    parser.add_argument('--tile-size', type=float, default=0, help='0 disables the tiled mode')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    app = start_qgis()
+    provider = load_provider()
+
+    from qgis.core import Qgis
+
+    results = {
+        'plugin_version': plugin_version(),
+        'qgis_version': Qgis.QGIS_VERSION,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'runs': [],
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scales:
+            results['runs'].append(run_scale(provider.id(), scale, args, directory))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    else:
+        print(output)
+
+    app.exitQgis()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Provider load and algorithm instantiation timings, measured headless.
+
+    python benchmarks/startup.py [--instances 1000]
+
+QGIS and its Processing plugin must be importable (PYTHONPATH pointing to
+the QGIS python directory and python/plugins). Results are printed as JSON.
+"""
+
+import argparse
+import json
+import time
+
+from qgis_app import import_plugin, load_provider, start_qgis
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--instances', type=int, default=1000, help='algorithm instances to create')
+    args = parser.parse_args()
+
+    app = start_qgis()
+
+    from qgis.core import QgsApplication
+
+    results = {}
+
+    started = time.perf_counter()
+    import_plugin('snapper_provider')
+    results['import_s'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    provider = load_provider()
+    results['provider_load_s'] = time.perf_counter() - started
+
+    algorithm_id = '{}:process_data'.format(provider.id())
+    registry = QgsApplication.processingRegistry()
+
+    started = time.perf_counter()
+    for _ in range(args.instances):
+        registry.createAlgorithmById(algorithm_id)
+    elapsed = time.perf_counter() - started
+
+    results['instances'] = args.instances
+    results['create_instance_ms'] = elapsed * 1000 / max(args.instances, 1)
+
+    print(json.dumps(results, indent=2))
+
+    registry.removeProvider(provider)
+    app.exitQgis()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Synthetic canal networks and delivery points for the benchmarks.
+
+Every line name is a random walk split into several features. The pieces of
+a canal, and the canals branching off earlier ones, start a little away from
+the vertex they should join (a near-miss gap expressed relative to the canal
+tolerance), so the snapping, repair and extension stages have real work to
+do. Delivery points are scattered along their canal with a perpendicular
+offset expressed relative to the points tolerance.
+"""
+
+import math
+import random
+from typing import List, Tuple
+
+from qgis.core import QgsFeature, QgsField, QgsGeometry, QgsPointXY, QgsVectorLayer
+from qgis.PyQt.QtCore import QVariant
+
+# default values of the algorithm options, see algorithms/main_alg/options
+NAME_FIELD = 'name'
+TYPE_FIELD = 'type'
+TOLERANCE = 0.0005
+
+# scale presets: the number of delivery points, and how they are spread
+SCALES = {
+    '10k': dict(line_names=100, points_per_line=100),
+    '100k': dict(line_names=1000, points_per_line=100),
+    '1M': dict(line_names=10000, points_per_line=100),
+}
+
+
+def _walk(start: QgsPointXY, heading: float, segments: int, length: float,
+          rng: random.Random) -> List[QgsPointXY]:
+    vertices = [start]
+    for _ in range(segments):
+        heading += rng.uniform(-0.3, 0.3)
+        last = vertices[-1]
+        vertices.append(QgsPointXY(last.x() + length * math.cos(heading), last.y() + length * math.sin(heading)))
+    return vertices
+
+
+def _nudged(point: QgsPointXY, distance: float, rng: random.Random) -> QgsPointXY:
+    angle = rng.uniform(0, 2 * math.pi)
+    return QgsPointXY(point.x() + distance * math.cos(angle), point.y() + distance * math.sin(angle))
+
+
+def _along(vertices: List[QgsPointXY], offset: float, rng: random.Random) -> QgsPointXY:
+    index = rng.randrange(len(vertices) - 1)
+    start, end = vertices[index], vertices[index + 1]
+    t = rng.random()
+    dx, dy = end.x() - start.x(), end.y() - start.y()
+    norm = math.hypot(dx, dy) or 1.0
+    return QgsPointXY(start.x() + t * dx - offset * dy / norm, start.y() + t * dy + offset * dx / norm)
+
+
+def generate(line_names: int = 100, segments_per_line: int = 50, features_per_line: int = 5,
+             points_per_line: int = 100, gap: float = 0.5, noise: float = 0.8,
+             tolerance_canals: float = TOLERANCE, tolerance_points: float = TOLERANCE,
+             seed: int = 0, crs: str = 'EPSG:4326') -> Tuple[QgsVectorLayer, QgsVectorLayer]:
+    """
+    Returns memory layers of canals and delivery points.
+
+    ``gap`` is the near-miss distance between pieces that should meet, as a
+    fraction of ``tolerance_canals``; ``noise`` is the largest offset of a
+    point from its canal, as a fraction of ``tolerance_points`` (above 1 some
+    points are left out of reach).
+    """
+    rng = random.Random(seed)
+
+    canals = QgsVectorLayer('MultiLineString?crs={}'.format(crs), 'canals', 'memory')
+    canals.dataProvider().addAttributes([QgsField(NAME_FIELD, QVariant.String)])
+    canals.updateFields()
+
+    points = QgsVectorLayer('Point?crs={}'.format(crs), 'points', 'memory')
+    # TYPEFIELD is a field of the delivery points, the intersections get TYPEVALUE in it
+    points.dataProvider().addAttributes([QgsField(NAME_FIELD, QVariant.String),
+                                         QgsField(TYPE_FIELD, QVariant.String)])
+    points.updateFields()
+
+    segment_length = 4 * tolerance_canals
+    # keep the density of the network constant whatever the number of lines
+    side = math.sqrt(line_names) * segments_per_line * segment_length / 2
+
+    walks: List[List[QgsPointXY]] = []
+    canal_features = []
+    point_features = []
+
+    for line in range(line_names):
+        name = 'canal {}'.format(line)
+
+        if walks and rng.random() < 0.7:
+            parent = rng.choice(walks)
+            start = _nudged(rng.choice(parent), gap * tolerance_canals, rng)
+        else:
+            start = QgsPointXY(rng.uniform(0, side), rng.uniform(0, side))
+
+        vertices = _walk(start, rng.uniform(0, 2 * math.pi), segments_per_line, segment_length, rng)
+        walks.append(vertices)
+
+        pieces = max(1, min(features_per_line, segments_per_line))
+        bounds = [round(i * segments_per_line / pieces) for i in range(pieces + 1)]
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            piece = vertices[first:last + 1]
+            if first:
+                piece = [_nudged(piece[0], gap * tolerance_canals, rng)] + piece[1:]
+
+            feature = QgsFeature(canals.fields())
+            feature.setGeometry(QgsGeometry.fromMultiPolylineXY([piece]))
+            feature.setAttributes([name])
+            canal_features.append(feature)
+
+        for _ in range(points_per_line):
+            feature = QgsFeature(points.fields())
+            offset = rng.uniform(-noise, noise) * tolerance_points
+            feature.setGeometry(QgsGeometry.fromPointXY(_along(vertices, offset, rng)))
+            feature.setAttributes([name, 'point'])
+            point_features.append(feature)
+
+    canals.dataProvider().addFeatures(canal_features)
+    points.dataProvider().addFeatures(point_features)
+    canals.updateExtents()
+    points.updateExtents()
+
+    return canals, points
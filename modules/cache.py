@@ -0,0 +1,193 @@
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransformContext, QgsFeature,
+                       QgsFeatureSource, QgsFields, QgsProcessingException, QgsVectorFileWriter, QgsVectorLayer,
+                       QgsWkbTypes)
+
+from .merging import conformed
+from .state import feature_digest
+
+# partial entries left by interrupted runs are removed after this many seconds
+PARTIAL_MAX_AGE = 24 * 60 * 60
+
+# bumped whenever the line stages change their results, so that older entries are not reused
+CACHE_VERSION = 2
+
+CANALS_LAYER = 'canals'
+INTERSECTIONS_LAYER = 'intersections'
+
+
+def stage_key(source: QgsFeatureSource, parameters: Dict[str, Any]) -> str:
+    """
+    Hash of the content of ``source`` (geometries and attributes of every
+    feature, in provider order), its schema and CRS, and the ``parameters`` the
+    cached stages depend on.
+    """
+    digest = hashlib.sha1('{}:{}'.format(CACHE_VERSION, sorted(parameters.items())).encode('utf-8'))
+    digest.update(source.sourceCrs().authid().encode('utf-8'))
+    for field in source.fields():
+        digest.update('{}:{}'.format(field.name(), field.type()).encode('utf-8'))
+
+    # provider order: an ORDER BY would make most providers sort the whole layer in memory
+    for feature in source.getFeatures():
+        digest.update(feature_digest(feature).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def _layer_path(directory: str, name: str) -> str:
+    return os.path.join(directory, '{}.gpkg'.format(name))
+
+
+def _size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(path) for name in names)
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class StageEntry:
+    """
+    The cached results of the line stages for one key: the split lines and
+    the intersection points, one GeoPackage each in the entry folder.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def layer(self, name: str) -> QgsVectorLayer:
+        layer = QgsVectorLayer(_layer_path(self.path, name), name, 'ogr')
+        if not layer.isValid():
+            raise QgsProcessingException('Could not read cached layer {} of {}'.format(name, self.path))
+        return layer
+
+    def features(self, name: str, fields: QgsFields) -> Iterator[QgsFeature]:
+        return conformed(self.layer(name), fields)
+
+
+class StageWriter:
+    """
+    Collects the results of the line stages into a partial entry, which
+    becomes visible to other runs on :meth:`commit` only. Every layer gets
+    its own GeoPackage, so that the writers never share a SQLite file.
+    """
+
+    def __init__(self, cache: 'StageCache', key: str) -> None:
+        self.cache = cache
+        self.key = key
+        self.path = os.path.join(cache.directory, '{}.{}.partial'.format(key, uuid.uuid4().hex))
+        self._writers: Dict[str, QgsVectorFileWriter] = {}
+
+    def create(self, name: str, fields: QgsFields, wkb_type: QgsWkbTypes.Type,
+               crs: QgsCoordinateReferenceSystem) -> None:
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = 'GPKG'
+        options.layerName = name
+
+        os.makedirs(self.path, exist_ok=True)
+        writer = QgsVectorFileWriter.create(_layer_path(self.path, name), fields, wkb_type, crs,
+                                            self.cache.transform_context, options)
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise QgsProcessingException('Could not create cache layer {}: {}'.format(name, writer.errorMessage()))
+        self._writers[name] = writer
+
+    def tee(self, name: str, features: Iterable[QgsFeature]) -> Iterator[QgsFeature]:
+        """
+        Passes ``features`` through, writing them to the ``name`` layer.
+        """
+        writer = self._writers[name]
+        for feature in features:
+            if not writer.addFeature(feature):
+                raise QgsProcessingException('Could not write to cache layer {}: {}'.format(
+                    name, writer.errorMessage()))
+            yield feature
+
+    def write(self, name: str, features: Iterable[QgsFeature]) -> None:
+        for _ in self.tee(name, features):
+            pass
+
+    def _close(self) -> None:
+        for writer in self._writers.values():
+            writer.flushBuffer()
+        self._writers.clear()
+
+    def commit(self) -> None:
+        self._close()
+        try:
+            os.replace(self.path, self.cache.path(self.key))
+        except OSError:
+            # another run committed the same key meanwhile, keep its entry
+            if not os.path.isdir(self.cache.path(self.key)):
+                raise
+            _remove(self.path)
+        self.cache.evict(keep=self.key)
+
+    def discard(self) -> None:
+        """
+        Closes and removes the partial entry; does nothing once committed.
+        """
+        self._close()
+        _remove(self.path)
+
+
+class StageCache:
+    """
+    On-disk cache of the line stages results across runs, keyed by
+    :func:`stage_key`. The least recently used entries are removed once the
+    cache grows over ``max_bytes``.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, transform_context: QgsCoordinateTransformContext) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.transform_context = transform_context
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[StageEntry]:
+        path = self.path(key)
+        if not os.path.isdir(path):
+            return None
+        # the modification time orders the entries for eviction
+        os.utime(path)
+        return StageEntry(path)
+
+    def writer(self, key: str) -> StageWriter:
+        return StageWriter(self, key)
+
+    def entries(self) -> List[str]:
+        # single file entries are left by older versions, they are evicted like the others
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                if not name.endswith('.partial')]
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.partial') and now - os.path.getmtime(path) > PARTIAL_MAX_AGE:
+                _remove(path)
+
+        entries = sorted(self.entries(), key=os.path.getmtime)
+        sizes = {path: _size(path) for path in entries}
+        total = sum(sizes.values())
+
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if keep is not None and path == self.path(keep):
+                continue
+            total -= sizes[path]
+            _remove(path)
@@ -0,0 +1,84 @@
+from typing import Tuple
+
+import numpy as np
+
+from .snapping import register_segments
+
+# relative tolerance on the segment parameters of a crossing
+PARAMETER_EPSILON = 1e-12
+
+
+def candidate_pairs(segments: np.ndarray) -> np.ndarray:
+    """
+    Returns the (n, 2) array of distinct segment index pairs sharing at least
+    one cell of a uniform grid sized after the typical segment extent (see
+    :func:`~.snapping.register_segments`).
+    """
+    low = np.minimum(segments[:, 0:2], segments[:, 2:4])
+    high = np.maximum(segments[:, 0:2], segments[:, 2:4])
+
+    extent = (high - low).max(axis=1)
+    cell_size = float(np.median(extent)) or float(extent.max()) or 1.0
+    origin = low.min(axis=0)
+
+    _, cell_ids, cell_segments = register_segments(segments, origin, cell_size)
+
+    # every entry is paired with the entries after it in the same cell
+    run_start = np.flatnonzero(np.r_[True, cell_ids[1:] != cell_ids[:-1]])
+    run_end = np.r_[run_start[1:], len(cell_ids)]
+    entry_end = np.repeat(run_end, run_end - run_start)
+    counts = entry_end - np.arange(len(cell_ids)) - 1
+
+    first = np.repeat(np.arange(len(cell_ids)), counts)
+    second = first + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    pairs = np.sort(np.column_stack((cell_segments[first], cell_segments[second])), axis=1)
+    return np.unique(pairs, axis=0)
+
+
+def segment_crossings(segments: np.ndarray, owners: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the points where segments of different owners cross or touch.
+
+    Returns an (n, 2) array of the owner pairs (smaller owner first) and the
+    matching (n, 2) array of crossing coordinates, each crossing of two
+    owners reported exactly once.
+    """
+    if len(segments) < 2:
+        return np.empty((0, 2), dtype=owners.dtype), np.empty((0, 2))
+
+    pairs = candidate_pairs(segments)
+    pairs = pairs[owners[pairs[:, 0]] != owners[pairs[:, 1]]]
+
+    first = segments[pairs[:, 0]]
+    second = segments[pairs[:, 1]]
+
+    start = first[:, 0:2]
+    direction = first[:, 2:4] - start
+    other_direction = second[:, 2:4] - second[:, 0:2]
+    offset = second[:, 0:2] - start
+
+    denominator = direction[:, 0] * other_direction[:, 1] - direction[:, 1] * other_direction[:, 0]
+    parallel = denominator == 0
+    denominator[parallel] = 1.0
+
+    measure = (offset[:, 0] * other_direction[:, 1] - offset[:, 1] * other_direction[:, 0]) / denominator
+    other_measure = (offset[:, 0] * direction[:, 1] - offset[:, 1] * direction[:, 0]) / denominator
+
+    crossing = ~parallel \
+        & (measure >= -PARAMETER_EPSILON) & (measure <= 1 + PARAMETER_EPSILON) \
+        & (other_measure >= -PARAMETER_EPSILON) & (other_measure <= 1 + PARAMETER_EPSILON)
+
+    points = start[crossing] + direction[crossing] * np.clip(measure[crossing], 0.0, 1.0)[:, None]
+    owner_pairs = np.sort(np.column_stack((owners[pairs[crossing, 0]], owners[pairs[crossing, 1]])), axis=1)
+
+    if not len(points):
+        return owner_pairs, points
+
+    # a crossing at a shared vertex is found from both adjacent segments
+    span = float(np.ptp(points, axis=0).max()) or 1.0
+    quantum = span * 1e-12
+    keys = np.column_stack((owner_pairs, np.round((points - points.min(axis=0)) / quantum)))
+    _, unique = np.unique(keys, axis=0, return_index=True)
+
+    return owner_pairs[unique], points[unique]
@@ -0,0 +1,214 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from .snapping import SegmentGrid, grid_cells
+from .wkb import Buffer, wkb_parts
+
+# cell offsets covering the 3x3 neighbourhood of a grid cell, each neighbour pair once
+NEIGHBOUR_CELLS = ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def line_ends(buffers: List[Buffer]) -> Tuple[np.ndarray, np.ndarray, List[np.ndarray]]:
+    """
+    Returns the x, y coordinates of the first and last vertex of every line
+    part of the WKB ``buffers`` as a (2n, 2) array, the index of the buffer
+    each end belongs to and the part views they were read from (end ``2i``
+    and ``2i + 1`` are the first and last vertex of part ``i``).
+    """
+    parts = []
+    owners = []
+    for owner, buffer in enumerate(buffers):
+        for part in wkb_parts(buffer):
+            if len(part) > 1:
+                parts.append(part)
+                owners.append(owner)
+
+    if not parts:
+        return np.empty((0, 2)), np.empty(0, dtype=np.int64), parts
+
+    coordinates = np.array([part[index, :2] for part in parts for index in (0, -1)], dtype=float)
+    return coordinates, np.repeat(np.array(owners, dtype=np.int64), 2), parts
+
+
+def neighbour_pairs(coordinates: np.ndarray, distance: float) -> np.ndarray:
+    """
+    Returns the (n, 2) array of the index pairs of the points lying within
+    ``distance`` of each other, found by hashing the points into a grid of
+    ``distance`` sized cells and comparing neighbouring cells only.
+    """
+    if len(coordinates) < 2 or distance <= 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    cells = grid_cells(coordinates, coordinates.min(axis=0), distance)
+    # a spare row keeps the neighbours above the top row from wrapping to the next column
+    rows = int(cells[:, 1].max()) + 2
+    cell_ids = cells[:, 0] * rows + cells[:, 1]
+
+    order = np.argsort(cell_ids, kind='stable')
+    sorted_ids = cell_ids[order]
+    indices = np.arange(len(coordinates))
+
+    pairs = []
+    for column, row in NEIGHBOUR_CELLS:
+        target = (cells[:, 0] + column) * rows + cells[:, 1] + row
+        first = np.searchsorted(sorted_ids, target, side='left')
+        counts = np.searchsorted(sorted_ids, target, side='right') - first
+
+        point = np.repeat(indices, counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        other = order[np.repeat(first, counts) + offset]
+
+        delta = coordinates[point] - coordinates[other]
+        close = np.einsum('ij,ij->i', delta, delta) <= distance ** 2
+        if column == 0 and row == 0:
+            close &= point < other
+        pairs.append(np.column_stack((point[close], other[close])))
+
+    return np.vstack(pairs)
+
+
+def union_find(pairs: np.ndarray, count: int) -> np.ndarray:
+    """
+    Returns the cluster label (smallest member index) of ``count`` items
+    joined by ``pairs``: roots are hooked onto the smaller root of every pair
+    and the paths compressed until all pairs share a root.
+    """
+    parent = np.arange(count)
+    if not len(pairs):
+        return parent
+
+    while True:
+        first = parent[pairs[:, 0]]
+        second = parent[pairs[:, 1]]
+        if (first == second).all():
+            return parent
+
+        root = np.minimum(first, second)
+        np.minimum.at(parent, first, root)
+        np.minimum.at(parent, second, root)
+
+        while True:
+            compressed = parent[parent]
+            if (compressed == parent).all():
+                break
+            parent = compressed
+
+
+def cluster_centres(coordinates: np.ndarray, labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the mean coordinate of the cluster of every point and the size of
+    that cluster. The members are summed in coordinate order so the result
+    does not depend on the order of the input.
+    """
+    order = np.lexsort((coordinates[:, 1], coordinates[:, 0], labels))
+    sorted_labels = labels[order]
+    starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+
+    sizes = np.diff(np.r_[starts, len(order)])
+    centres = np.add.reduceat(coordinates[order], starts, axis=0) / sizes[:, None]
+
+    group = np.empty(len(order), dtype=np.int64)
+    group[order] = np.repeat(np.arange(len(starts)), sizes)
+
+    return centres[group], sizes[group]
+
+
+def _part_segments(parts: List[np.ndarray], owners: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    segments = np.vstack([np.hstack((part[:-1, :2], part[1:, :2])) for part in parts])
+    return segments, np.repeat(owners[::2], [len(part) - 1 for part in parts])
+
+
+def _move_ends(parts: List[np.ndarray], coordinates: np.ndarray, moved: np.ndarray) -> None:
+    for end in np.flatnonzero(moved).tolist():
+        part = parts[end // 2]
+        part[0 if end % 2 == 0 else -1, :2] = coordinates[end]
+
+
+def snap_endpoints(buffers: List[bytearray], tolerance: float) -> None:
+    """
+    Snaps the line end points of the WKB ``buffers`` in place.
+
+    End points within ``tolerance`` of each other are clustered and moved to
+    the centre of their cluster. The two ends of one line part are never
+    paired with each other, so a part shorter than the tolerance keeps its
+    length. Clusters are single-linkage chains and may span more than the
+    tolerance: their members farther than ``tolerance`` from the centre are
+    left in place, as is the farther end of a part whose both ends fall in
+    one cluster through other lines, so no end point moves by more than the
+    tolerance. The end points left alone are then moved to the closest point
+    of another line within ``tolerance``. Both passes only depend on the
+    geometries, not on their order.
+    """
+    coordinates, owners, parts = line_ends(buffers)
+    if not len(coordinates) or tolerance <= 0:
+        return
+
+    pairs = neighbour_pairs(coordinates, tolerance)
+    pairs = pairs[pairs[:, 0] // 2 != pairs[:, 1] // 2]
+
+    labels = union_find(pairs, len(coordinates))
+    centres, sizes = cluster_centres(coordinates, labels)
+    offsets = np.hypot(centres[:, 0] - coordinates[:, 0], centres[:, 1] - coordinates[:, 1])
+    joined = (sizes > 1) & (offsets <= tolerance)
+
+    # an open part with both ends joined to one cluster would collapse, its farther end stays
+    first, last = np.arange(0, len(coordinates), 2), np.arange(1, len(coordinates), 2)
+    closed = (coordinates[first] == coordinates[last]).all(axis=1)
+    collapsing = (labels[first] == labels[last]) & joined[first] & joined[last] & ~closed
+    farther = np.where(offsets[first] > offsets[last], first, last)
+    joined[farther[collapsing]] = False
+
+    _move_ends(parts, centres, joined)
+
+    free = np.flatnonzero(~joined)
+    if not len(free):
+        return
+
+    segments, segment_owners = _part_segments(parts, owners)
+    snapped, found = SegmentGrid(segments, tolerance, segment_owners).snap(coordinates[free], owners[free])
+    moved = np.zeros(len(coordinates), dtype=bool)
+    moved[free[found]] = True
+    coordinates[free[found]] = snapped[found]
+    _move_ends(parts, coordinates, moved)
+
+
+def end_degrees(buffers: List[Buffer], distance: float) -> Tuple[np.ndarray, np.ndarray, List[np.ndarray]]:
+    """
+    Returns, for every end of :func:`line_ends`, the number of other line
+    ends plus other lines lying within ``distance`` of it, with the owners
+    and part views of the ends. An end of degree 0 is a dangle.
+    """
+    coordinates, owners, parts = line_ends(buffers)
+    degrees = np.zeros(len(coordinates), dtype=np.int64)
+    if not parts:
+        return degrees, owners, parts
+
+    np.add.at(degrees, neighbour_pairs(coordinates, distance).ravel(), 1)
+
+    segments, segment_owners = _part_segments(parts, owners)
+    _, touching = SegmentGrid(segments, distance, segment_owners).snap(coordinates, owners)
+
+    return degrees + touching, owners, parts
+
+
+def extend_dangles(buffers: List[bytearray], distance: float, connected: float) -> np.ndarray:
+    """
+    Extends in place the dangling ends (nothing within ``connected`` of them)
+    of the WKB lines by ``distance``, along their first or last segment.
+    Returns the mask of the buffers that were changed.
+    """
+    changed = np.zeros(len(buffers), dtype=bool)
+    degrees, owners, parts = end_degrees(buffers, connected)
+
+    for end in np.flatnonzero(degrees == 0).tolist():
+        part = parts[end // 2]
+        tip, previous = (0, 1) if end % 2 == 0 else (-1, -2)
+
+        direction = part[tip, :2] - part[previous, :2]
+        length = float(np.hypot(direction[0], direction[1]))
+        if length > 0:
+            part[tip, :2] += direction * (distance / length)
+            changed[owners[end]] = True
+
+    return changed
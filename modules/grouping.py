@@ -0,0 +1,157 @@
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from qgis.core import QgsCoordinateTransform, QgsFeature, QgsFeedback
+
+from .profiling import Profiler
+from .snapping import SegmentIndex, snap_coordinates
+from .state import StateStore
+from .store import FeatureStore, plain_value
+
+# groups prepared ahead per worker while the current one is being written
+LOOKAHEAD = 2
+
+
+def group_key(value: Any) -> Any:
+    # NULL attributes come through as an invalid QVariant, ints stored as reals
+    # must still match their integer counterparts in the other layer
+    value = plain_value(value)
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def index_features(features: Iterable[QgsFeature], field_index: int, index: SegmentIndex,
+                   transform: Optional[QgsCoordinateTransform] = None) -> Iterator[QgsFeature]:
+    """
+    Passes the line features through, adding each of them to ``index`` under
+    its line name, reprojected with ``transform`` (the features themselves
+    are left in their CRS).
+    """
+    transform = transform if transform is not None and not transform.isShortCircuited() else None
+    for feature in features:
+        geometry = feature.geometry()
+        if transform is not None and not geometry.isNull():
+            geometry.transform(transform)
+        index.add_line(group_key(feature.attributes()[field_index]), geometry)
+        yield feature
+
+
+def group_order(key: Any) -> Tuple[bool, str]:
+    return key is not None, key or ''
+
+
+def group_ranks(values: Iterable[Any]) -> np.ndarray:
+    """
+    Position of every value's group key in :func:`group_order`.
+    """
+    keys = [group_key(value) for value in values]
+    rank = {key: position for position, key in enumerate(sorted(set(keys), key=group_order))}
+    return np.array([rank[key] for key in keys], dtype=np.int64)
+
+
+def _timed_snap(line_buffers: List[bytes], coordinates: np.ndarray,
+                tolerance: float) -> Tuple[np.ndarray, float]:
+    started = time.perf_counter()
+    snapped = snap_coordinates(line_buffers, coordinates, tolerance)
+    return snapped, time.perf_counter() - started
+
+
+def _shutdown(executor: ThreadPoolExecutor) -> None:
+    # cancel_futures is Python 3.9+; without it only the few looked ahead groups are waited for
+    if sys.version_info >= (3, 9):
+        executor.shutdown(wait=True, cancel_futures=True)
+    else:
+        executor.shutdown(wait=True)
+
+
+def snap_point_groups(points: FeatureStore, name_index: int, lines: SegmentIndex, uuid_index: int,
+                      workers: int = 1, feedback: Optional[QgsFeedback] = None,
+                      state: Optional[StateStore] = None,
+                      profiler: Optional[Profiler] = None,
+                      spatial: bool = False, scope: Optional[str] = None) -> Iterator[QgsFeature]:
+    """
+    Snaps every group of points to the lines sharing its name. Groups are
+    shipped to the workers as coordinate arrays sliced from the store, a
+    few at a time (:data:`LOOKAHEAD` per worker), and come back in line name
+    order, each sorted by the uuid field, so the output does not depend on
+    the number of workers. The features are only rebuilt from the store as
+    they are yielded.
+
+    With a ``state`` store, groups whose lines and points did not change
+    since the previous run reuse the stored snapped points, stored per
+    ``scope`` (see :meth:`~.state.StateStore.group_name`). With a
+    ``profiler``, the snapping time of every computed group is recorded.
+    With ``spatial``, each group is sorted along a Hilbert curve
+    instead of by uuid.
+    """
+    groups = points.groups(name_index, uuid_index, group_key, group_order, spatial)
+    coordinates = points.coordinates[:, :2]
+
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def finish(name: Any, ids: np.ndarray, job: Callable[[], Tuple[np.ndarray, float]]) -> Callable[[], List[bytes]]:
+        def result() -> List[bytes]:
+            snapped, seconds = job()
+            if profiler is not None:
+                profiler.group(name, len(ids), seconds)
+            return points.wkb(ids, snapped)
+        return result
+
+    def schedule(name: Any, ids: np.ndarray) -> Callable[[], List[bytes]]:
+        if state is not None:
+            uuids = [str(value) for value in points.values(uuid_index, ids)]
+            digest = state.group_digest(lines.lines(name), uuids, points.wkb(ids), lines.tolerance)
+            stored = state.snapped_group(state.group_name(name, scope), digest)
+            if stored is not None and all(value in stored for value in uuids):
+                return lambda: [stored[value] for value in uuids]
+
+        group_coordinates = coordinates[points.vertices(ids)]
+        if executor is not None:
+            job = executor.submit(_timed_snap, lines.lines(name), group_coordinates, lines.tolerance).result
+        else:
+            job = partial(_timed_snap, lines.lines(name), group_coordinates, lines.tolerance)
+
+        job = finish(name, ids, job)
+
+        if state is None:
+            return job
+
+        def store() -> List[bytes]:
+            buffers = job()
+            state.store_group(state.group_name(name, scope), digest, uuids, buffers)
+            return buffers
+
+        return store
+
+    total = 100.0 / len(groups) if groups else 0
+
+    # only a few groups per worker are prepared (looked up in the state, submitted) ahead of the one yielded
+    window = max(workers, 1) * LOOKAHEAD
+    upcoming = iter(groups)
+    pending: Deque[Tuple[np.ndarray, Callable[[], List[bytes]]]] = deque()
+
+    try:
+        for current in range(len(groups)):
+            if feedback is not None:
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(current * total)
+
+            for name, ids in islice(upcoming, window - len(pending)):
+                pending.append((ids, schedule(name, ids)))
+
+            ids, job = pending.popleft()
+            yield from points.features(ids, job())
+    finally:
+        if executor is not None:
+            _shutdown(executor)
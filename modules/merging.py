@@ -0,0 +1,117 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import QgsCoordinateTransform, QgsFeature, QgsField, QgsFields, QgsVectorLayer, QgsWkbTypes
+
+from .store import plain_value
+
+# provenance fields native:mergevectorlayers added to its output
+LAYER_FIELD = 'layer'
+PATH_FIELD = 'path'
+
+
+def merge_fields(*fields_list: QgsFields) -> QgsFields:
+    """
+    Union of the fields by name in order of appearance, plus the layer and
+    path fields, like native:mergevectorlayers. A field whose type differs
+    between the layers becomes a string field.
+    """
+    merged: List[QgsField] = []
+    positions: Dict[str, int] = {}
+
+    for fields in fields_list:
+        for field in fields:
+            position = positions.get(field.name())
+            if position is None:
+                positions[field.name()] = len(merged)
+                merged.append(QgsField(field))
+            elif merged[position].type() != field.type():
+                merged[position] = QgsField(field.name(), QVariant.String)
+
+    result = QgsFields()
+    for field in merged:
+        result.append(field)
+
+    for name in (LAYER_FIELD, PATH_FIELD):
+        if result.indexFromName(name) < 0:
+            result.append(QgsField(name, QVariant.String))
+
+    return result
+
+
+def merge_wkb_type(*wkb_types: QgsWkbTypes.Type) -> QgsWkbTypes.Type:
+    """
+    The geometry type holding all of ``wkb_types``: multi-part, Z or M as
+    soon as one of them is.
+    """
+    result = QgsWkbTypes.flatType(wkb_types[0])
+
+    if any(QgsWkbTypes.isMultiType(wkb_type) for wkb_type in wkb_types):
+        result = QgsWkbTypes.multiType(result)
+    if any(QgsWkbTypes.hasZ(wkb_type) for wkb_type in wkb_types):
+        result = QgsWkbTypes.addZ(result)
+    if any(QgsWkbTypes.hasM(wkb_type) for wkb_type in wkb_types):
+        result = QgsWkbTypes.addM(result)
+
+    return result
+
+
+def conformed(layer: QgsVectorLayer, fields: QgsFields) -> Iterator[QgsFeature]:
+    """
+    Features of ``layer`` copied onto ``fields``, the attributes being
+    matched by name (file layers may add their own fid column).
+    """
+    mapping = [layer.fields().indexFromName(field.name()) for field in fields]
+
+    for feature in layer.getFeatures():
+        attributes = feature.attributes()
+        result = QgsFeature(fields, feature.id())
+        result.setAttributes([attributes[index] if index >= 0 else None for index in mapping])
+        if feature.hasGeometry():
+            result.setGeometry(feature.geometry())
+        yield result
+
+
+def conform(features: Iterable[QgsFeature], source_fields: QgsFields, fields: QgsFields, layer_name: str,
+            wkb_type: QgsWkbTypes.Type, transform: Optional[QgsCoordinateTransform] = None,
+            path: Optional[str] = None) -> Iterator[QgsFeature]:
+    """
+    Copies the features of a layer with ``source_fields`` onto the merged
+    ``fields`` and ``wkb_type`` (see :func:`merge_fields` and
+    :func:`merge_wkb_type`), reprojecting them with ``transform``. The layer
+    and path fields are set to ``layer_name`` and ``path``.
+    """
+    mapping: List[int] = [fields.indexFromName(field.name()) for field in source_fields]
+    as_string = [fields.field(index).type() == QVariant.String and field.type() != QVariant.String
+                 for index, field in zip(mapping, source_fields)]
+    layer_index = fields.indexFromName(LAYER_FIELD)
+    path_index = fields.indexFromName(PATH_FIELD)
+
+    multi = QgsWkbTypes.isMultiType(wkb_type)
+    has_z = QgsWkbTypes.hasZ(wkb_type)
+    has_m = QgsWkbTypes.hasM(wkb_type)
+    transform = transform if transform is not None and not transform.isShortCircuited() else None
+
+    for feature in features:
+        attributes = [None] * fields.count()
+        for index, string, value in zip(mapping, as_string, feature.attributes()):
+            attributes[index] = str(value) if string and plain_value(value) is not None else value
+        attributes[layer_index] = layer_name
+        attributes[path_index] = path
+
+        merged = QgsFeature(fields, feature.id())
+        merged.setAttributes(attributes)
+
+        if feature.hasGeometry():
+            geometry = feature.geometry()
+            if transform is not None:
+                geometry.transform(transform)
+            if multi:
+                geometry.convertToMultiType()
+            if has_z and not QgsWkbTypes.hasZ(geometry.wkbType()):
+                geometry.get().addZValue(0)
+            if has_m and not QgsWkbTypes.hasM(geometry.wkbType()):
+                geometry.get().addMValue(0)
+            merged.setGeometry(geometry)
+
+        yield merged
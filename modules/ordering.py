@@ -0,0 +1,70 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+# cells per side of the Hilbert curve grid: 2 ** HILBERT_ORDER
+HILBERT_ORDER = 16
+
+# key of the rows without coordinates, after all the others
+NO_KEY = np.iinfo(np.uint64).max
+
+
+def bounds(xy: np.ndarray) -> Optional[Tuple[float, float, float, float]]:
+    valid = np.isfinite(xy).all(axis=1)
+    if not valid.any():
+        return None
+    xmin, ymin = xy[valid].min(axis=0)
+    xmax, ymax = xy[valid].max(axis=0)
+    return float(xmin), float(ymin), float(xmax), float(ymax)
+
+
+def hilbert_keys(xy: np.ndarray, extent: Optional[Tuple[float, float, float, float]] = None,
+                 order: int = HILBERT_ORDER) -> np.ndarray:
+    """
+    Positions of the (n, 2) points along a Hilbert curve covering ``extent``
+    (xmin, ymin, xmax, ymax; the bounds of the points by default), so that
+    points close on the curve are close in space. Rows with NaN coordinates
+    get :data:`NO_KEY`.
+    """
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    keys = np.full(len(xy), NO_KEY, dtype=np.uint64)
+
+    extent = extent if extent is not None else bounds(xy)
+    valid = np.isfinite(xy).all(axis=1)
+    if extent is None or not valid.any():
+        return keys
+
+    side = 1 << order
+    xmin, ymin, xmax, ymax = extent
+    scale = (side - 1) / max(xmax - xmin, ymax - ymin, np.finfo(float).tiny)
+
+    x = np.clip((xy[valid, 0] - xmin) * scale, 0, side - 1).astype(np.uint64)
+    y = np.clip((xy[valid, 1] - ymin) * scale, 0, side - 1).astype(np.uint64)
+    d = np.zeros(len(x), dtype=np.uint64)
+    last = np.uint64(side - 1)
+
+    s = side >> 1
+    while s > 0:
+        step = np.uint64(s)
+        rx = (x & step) > 0
+        ry = (y & step) > 0
+        d += step * step * ((3 * rx.astype(np.uint64)) ^ ry.astype(np.uint64))
+
+        # rotate the quadrant so that the curve stays continuous
+        flip = ~ry & rx
+        x = np.where(flip, last - x, x)
+        y = np.where(flip, last - y, y)
+        x, y = np.where(ry, x, y), np.where(ry, y, x)
+        s >>= 1
+
+    keys[valid] = d
+    return keys
+
+
+def spatial_order(ranks: np.ndarray, xy: np.ndarray,
+                  extent: Optional[Tuple[float, float, float, float]] = None) -> np.ndarray:
+    """
+    Indices sorting the rows by ``ranks`` (e.g. the line name order), then
+    along the Hilbert curve (see :func:`hilbert_keys`).
+    """
+    return np.lexsort((hilbert_keys(xy, extent), ranks))
@@ -0,0 +1,424 @@
+"""
+In-process replacement of the former snap_lines graphical model:
+
+    uuid tagging -> self snapping of line end points -> repair -> extension
+    -> repair -> crossings of the extended lines -> split of the lines at the
+    same crossings
+
+Features stream through the per-feature stages; the end point snapping
+needs every line at once, and so do the intersection and split stages,
+which keep the repaired lines and their extended copies.
+"""
+
+import os
+import uuid
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import QgsFeature, QgsFeedback, QgsField, QgsFields, QgsGeometry, QgsPointXY, QgsWkbTypes
+
+from .crossings import segment_crossings
+from .endpoints import extend_dangles, snap_endpoints
+from .grouping import group_ranks
+from .ordering import spatial_order
+from .profiling import Profiler, profiled
+from .state import feature_digest
+from .wkb import wkb_segments
+
+UUID_FIELD = 'uuid'
+
+# uuids drawn from the system random source at once
+UUID_BATCH = 4096
+
+# namespace of the uuids derived from the feature content
+CONTENT_UUID_NAMESPACE = uuid.UUID('5c1f0a3e-8d42-4b7e-9a61-2f3d7c9e4b10')
+
+# suffix of the fields describing the second line of an intersection point
+SECOND_SUFFIX = '_2'
+
+# dangling line ends are extended by this fraction of the line snapping tolerance
+EXTENSION_RATIO = 0.01
+
+# line ends closer than this fraction of the extension to another line are connected to it
+CONNECTED_RATIO = 0.001
+
+
+def with_field(fields: QgsFields, name: str) -> QgsFields:
+    result = QgsFields(fields)
+    if result.indexFromName(name) < 0:
+        result.append(QgsField(name, QVariant.String))
+    return result
+
+
+def with_uuid_field(fields: QgsFields) -> QgsFields:
+    return with_field(fields, UUID_FIELD)
+
+
+def random_uuids(batch_size: int = UUID_BATCH) -> Iterator[str]:
+    """
+    Endless uuid4 strings, the random bytes of ``batch_size`` of them being
+    drawn at once.
+    """
+    while True:
+        data = os.urandom(16 * batch_size)
+        for offset in range(0, len(data), 16):
+            yield str(uuid.UUID(bytes=data[offset:offset + 16], version=4))
+
+
+def content_uuid_assigner() -> Callable[[QgsFeature], str]:
+    """
+    Returns a function giving a feature a uuid derived from its attributes
+    and geometry, so that the same input gets the same uuids in every run.
+    Identical features are told apart by their order of appearance.
+    """
+    seen: Dict[str, int] = {}
+
+    def assign(feature: QgsFeature) -> str:
+        digest = feature_digest(feature)
+        position = seen.get(digest, 0)
+        seen[digest] = position + 1
+        return str(uuid.uuid5(CONTENT_UUID_NAMESPACE, '{}:{}'.format(digest, position)))
+
+    return assign
+
+
+def tag_uuid(features: Iterable[QgsFeature], fields: QgsFields,
+             assign: Optional[Callable[[QgsFeature], str]] = None) -> Iterator[QgsFeature]:
+    """
+    Copies the features onto ``fields`` (the source fields plus the uuid
+    field) with a fresh uuid4 value, or the value ``assign`` gives the
+    source feature.
+    """
+    index = fields.indexFromName(UUID_FIELD)
+    count = fields.count()
+    fresh = random_uuids() if assign is None else None
+
+    for feature in features:
+        attributes = feature.attributes()
+        attributes.extend([None] * (count - len(attributes)))
+        attributes[index] = assign(feature) if fresh is None else next(fresh)
+
+        tagged = QgsFeature(fields, feature.id())
+        tagged.setGeometry(feature.geometry())
+        tagged.setAttributes(attributes)
+        yield tagged
+
+
+def snap_lines(features: Iterable[QgsFeature], tolerance: float) -> Iterator[QgsFeature]:
+    """
+    Joins the line end points lying within ``tolerance`` of each other and
+    moves the remaining ones to the closest other line within ``tolerance``
+    (see :func:`~.endpoints.snap_endpoints`). Unlike native:snapgeometries
+    run with the layer as its own reference, the result does not depend on
+    the feature order.
+    """
+    features = list(features)
+    buffers = [bytearray(feature.geometry().asWkb()) if feature.hasGeometry() else None for feature in features]
+
+    snap_endpoints([buffer for buffer in buffers if buffer is not None], tolerance)
+
+    for feature, buffer in zip(features, buffers):
+        if buffer is not None:
+            geometry = QgsGeometry()
+            geometry.fromWkb(bytes(buffer))
+            feature.setGeometry(geometry)
+        yield feature
+
+
+def fix_geometry(geometry: QgsGeometry) -> Optional[QgsGeometry]:
+    """
+    Repairs a line geometry the way native:fixgeometries does. Returns None
+    when nothing valid is left of it.
+    """
+    if geometry.isNull():
+        return geometry
+
+    fixed = geometry.makeValid()
+    if fixed.isNull() or fixed.isEmpty():
+        return None
+
+    if QgsWkbTypes.flatType(fixed.wkbType()) == QgsWkbTypes.GeometryCollection:
+        fixed = fixed.convertToType(QgsWkbTypes.LineGeometry, True)
+        if fixed.isNull():
+            return None
+
+    fixed.convertToMultiType()
+    return fixed
+
+
+def repair_geometry(geometry: QgsGeometry) -> Tuple[Optional[QgsGeometry], bool]:
+    """
+    Runs :func:`fix_geometry` on the geometries GEOS reports invalid only;
+    valid ones are just made multi-part. Returns the result and whether a
+    repair was needed.
+    """
+    if geometry.isNull() or (not geometry.isEmpty() and geometry.isGeosValid()):
+        result = QgsGeometry(geometry)
+        if not result.isNull():
+            result.convertToMultiType()
+        return result, False
+
+    return fix_geometry(geometry), True
+
+
+def fix_geometries(features: Iterable[QgsFeature], repairs: Optional[Counter] = None) -> Iterator[QgsFeature]:
+    """
+    Repairs the invalid features and drops those with nothing valid left,
+    counting them under ``repaired`` and ``dropped`` in ``repairs``.
+    """
+    for feature in features:
+        fixed, repaired = repair_geometry(feature.geometry())
+        if repairs is not None:
+            repairs['repaired'] += repaired
+            repairs['dropped'] += fixed is None
+        if fixed is not None:
+            feature.setGeometry(fixed)
+            yield feature
+
+
+def intersection_fields(fields: QgsFields, name_field: str, type_field: str) -> QgsFields:
+    """
+    Fields of the intersection points: the line fields, the type field and a
+    copy of the line name and uuid fields for the second line of a crossing.
+    """
+    result = with_field(fields, type_field)
+
+    for name in (name_field, UUID_FIELD):
+        field = QgsField(fields.field(name))
+        field.setName(name + SECOND_SUFFIX)
+        if result.indexFromName(field.name()) < 0:
+            result.append(field)
+
+    return result
+
+
+def split_line(geometry: QgsGeometry, points: List[QgsPointXY]) -> List[QgsGeometry]:
+    """
+    Cuts every part of a (multi)line at the given points, each point being
+    applied to the part closest to it, in the order of their measures along
+    the part.
+    """
+    parts = [part.clone() for part in geometry.constParts()]
+    part_geometries = [QgsGeometry(part.clone()) for part in parts]
+    measures: List[List[float]] = [[] for _ in parts]
+
+    for point in points:
+        point_geometry = QgsGeometry.fromPointXY(point)
+        closest = min(range(len(parts)), key=lambda i: part_geometries[i].distance(point_geometry)) \
+            if len(parts) > 1 else 0
+        measures[closest].append(part_geometries[closest].lineLocatePoint(point_geometry))
+
+    pieces = []
+    for part, part_measures in zip(parts, measures):
+        length = part.length()
+        cuts = [0.0] + sorted(m for m in set(part_measures) if 0.0 < m < length) + [length]
+        for start, end in zip(cuts[:-1], cuts[1:]):
+            piece = QgsGeometry(part.curveSubstring(start, end) if len(cuts) > 2 else part.clone())
+            piece.convertToMultiType()
+            pieces.append(piece)
+
+    return pieces
+
+
+class LineNetwork:
+    """
+    The repaired lines of a network together with their extended copies. The
+    crossings of the extended lines are computed once and serve both the
+    intersection points and the split of the lines.
+    """
+
+    def __init__(self, fields: QgsFields) -> None:
+        self.fields = fields
+        self.features: Dict[int, QgsFeature] = {}
+        self.extended: Dict[int, QgsGeometry] = {}
+        self._crossings: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def add(self, feature: QgsFeature, extended: QgsGeometry) -> None:
+        fid = len(self.features)
+        feature.setId(fid)
+        self.features[fid] = feature
+        self.extended[fid] = extended
+        self._crossings = None
+
+    def crossings(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The line id pairs and points of the crossings of the extended lines
+        (see :func:`~.crossings.segment_crossings`).
+        """
+        if self._crossings is None:
+            segments = []
+            owners = []
+            for fid, extended in self.extended.items():
+                if not extended.isNull():
+                    line_segments = wkb_segments(bytes(extended.asWkb()))
+                    segments.append(line_segments)
+                    owners.append(np.full(len(line_segments), fid))
+
+            if segments:
+                self._crossings = segment_crossings(np.vstack(segments), np.concatenate(owners))
+            else:
+                self._crossings = np.empty((0, 2), dtype=int), np.empty((0, 2))
+
+        return self._crossings
+
+    def line_crossings(self) -> Dict[int, np.ndarray]:
+        """
+        The crossing points of every line id crossed by another line.
+        """
+        owner_pairs, points = self.crossings()
+
+        owners = np.concatenate((owner_pairs[:, 0], owner_pairs[:, 1]))
+        order = np.argsort(owners, kind='stable')
+        owners = owners[order]
+        points = np.vstack((points, points))[order]
+
+        fids, starts = np.unique(owners, return_index=True)
+        return dict(zip(fids.tolist(), np.split(points, starts[1:])))
+
+    def intersections(self, fields: QgsFields, name_field: str, type_field: str, type_value: str,
+                      feedback: Optional[QgsFeedback] = None, spatial: bool = False) -> Iterator[QgsFeature]:
+        """
+        Crossing points of the extended lines, each reported once. A point
+        carries the attributes of the line with the smaller id, ``type_value``
+        in ``type_field`` and the name and uuid of the other line in the
+        ``_2`` suffixed fields (see :func:`intersection_fields`). With
+        ``spatial``, the points are sorted by line name, then along a Hilbert
+        curve.
+        """
+        owner_pairs, points = self.crossings()
+
+        type_index = fields.indexFromName(type_field)
+        name_index = self.fields.indexFromName(name_field)
+
+        if spatial and len(points):
+            ranks = group_ranks(self.features[first].attributes()[name_index] for first in owner_pairs[:, 0].tolist())
+            order = spatial_order(ranks, points)
+            owner_pairs, points = owner_pairs[order], points[order]
+
+        uuid_index = self.fields.indexFromName(UUID_FIELD)
+        second_name_index = fields.indexFromName(name_field + SECOND_SUFFIX)
+        second_uuid_index = fields.indexFromName(UUID_FIELD + SECOND_SUFFIX)
+
+        total = 100.0 / len(points) if len(points) else 0
+
+        for current, ((first, second), (x, y)) in enumerate(zip(owner_pairs.tolist(), points.tolist())):
+            if feedback is not None:
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(current * total)
+
+            attributes = self.features[first].attributes()
+            other = self.features[second].attributes()
+            attributes.extend([None] * (fields.count() - len(attributes)))
+            attributes[type_index] = type_value
+            attributes[second_name_index] = other[name_index]
+            attributes[second_uuid_index] = other[uuid_index]
+
+            intersection = QgsFeature(fields)
+            intersection.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+            intersection.setAttributes(attributes)
+            yield intersection
+
+    def split(self, feedback: Optional[QgsFeedback] = None,
+              name_field: Optional[str] = None) -> Iterator[QgsFeature]:
+        """
+        Repaired lines cut wherever an extended line of the network crosses
+        them, like native:splitwithlines. The cuts are the crossings already
+        found for the intersection points; those lying on the extension of a
+        line fall outside of it and are ignored.
+
+        With a ``name_field``, the lines come out sorted by name, then along a
+        Hilbert curve through their bounding box centres.
+        """
+        line_crossings = self.line_crossings()
+        total = 100.0 / len(self.features) if self.features else 0
+
+        lines = list(self.features.items())
+        if name_field is not None and lines:
+            name_index = self.fields.indexFromName(name_field)
+            ranks = group_ranks(feature.attributes()[name_index] for _, feature in lines)
+            centres = [feature.geometry().boundingBox().center() if feature.hasGeometry() else None
+                       for _, feature in lines]
+            xy = np.array([[centre.x(), centre.y()] if centre is not None else [np.nan, np.nan]
+                           for centre in centres], dtype=float)
+            lines = [lines[position] for position in spatial_order(ranks, xy).tolist()]
+
+        for current, (fid, feature) in enumerate(lines):
+            if feedback is not None:
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(current * total)
+
+            points = line_crossings.get(fid)
+            if not feature.hasGeometry() or points is None:
+                yield feature
+                continue
+
+            for piece in split_line(feature.geometry(), [QgsPointXY(x, y) for x, y in points.tolist()]):
+                part = QgsFeature(feature)
+                part.setGeometry(piece)
+                yield part
+
+
+def extend_lines(features: Iterable[QgsFeature], distance: float,
+                 repairs: Optional[Counter] = None) -> Iterator[Tuple[QgsFeature, QgsGeometry]]:
+    """
+    Pairs every line with its copy extended by ``distance`` at its dangling
+    ends and repaired again if it became invalid (a null geometry if nothing
+    valid is left of it). Ends touching another line or line end are not
+    extended, so most lines are paired with their own geometry, which was
+    already checked by :func:`fix_geometries`.
+    """
+    features = list(features)
+    buffers = [bytearray(feature.geometry().asWkb()) if feature.hasGeometry() else None for feature in features]
+
+    present = [buffer for buffer in buffers if buffer is not None]
+    changed = iter(extend_dangles(present, distance, distance * CONNECTED_RATIO).tolist())
+
+    for feature, buffer in zip(features, buffers):
+        if buffer is None:
+            yield feature, QgsGeometry()
+        elif next(changed):
+            extended = QgsGeometry()
+            extended.fromWkb(bytes(buffer))
+            extended, repaired = repair_geometry(extended)
+            if repairs is not None:
+                repairs['repaired'] += repaired
+            yield feature, extended if extended is not None else QgsGeometry()
+        else:
+            yield feature, feature.geometry()
+
+
+def build_network(features: Iterable[QgsFeature], fields: QgsFields, tolerance: float,
+                  feedback: Optional[QgsFeedback] = None,
+                  assign: Optional[Callable[[QgsFeature], str]] = None,
+                  profiler: Optional[Profiler] = None) -> LineNetwork:
+    """
+    Streams the source lines through uuid tagging, snapping, repair and
+    extension into a :class:`LineNetwork`.
+    """
+    network = LineNetwork(fields)
+
+    tagged = profiled(profiler, 'uuid tagging', tag_uuid(features, fields, assign))
+    snapped = profiled(profiler, 'line snapping', snap_lines(tagged, tolerance))
+    repairs = Counter()
+    extension_repairs = Counter()
+
+    fixed = profiled(profiler, 'geometry repair', fix_geometries(snapped, repairs))
+    extended = profiled(profiler, 'line extension',
+                        extend_lines(fixed, tolerance * EXTENSION_RATIO, extension_repairs))
+
+    for feature, extended_geometry in extended:
+        if feedback is not None and feedback.isCanceled():
+            break
+        network.add(feature, extended_geometry)
+
+    if feedback is not None:
+        feedback.pushInfo('Geometry repair: {} invalid lines repaired, {} dropped'.format(repairs['repaired'],
+                                                                                         repairs['dropped']))
+        feedback.pushInfo('Line extension: {} extended lines repaired'.format(extension_repairs['repaired']))
+
+    return network
@@ -0,0 +1,165 @@
+import csv
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional
+
+# only the feedback type comes from QGIS, which keeps the profiler testable without it
+if TYPE_CHECKING:
+    from qgis.core import QgsFeedback
+
+# slowest line name groups reported through the feedback
+REPORTED_GROUPS = 10
+
+
+def peak_rss() -> Optional[int]:
+    """
+    Peak resident set size of the process in bytes, None where it cannot be
+    queried.
+    """
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_rss()
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _windows_peak_rss() -> Optional[int]:
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except (AttributeError, OSError):
+        pass
+    return None
+
+
+class Profiler:
+    """
+    Wall time, feature counts and peak RSS per processing stage, plus the
+    snapping time of every line name group.
+
+    Time is accounted exclusively: while a stage pulls features from an
+    upstream streaming stage, the time is charged to the upstream one.
+
+    Timing every streamed feature costs a few microseconds each, so with
+    ``streams`` off :func:`profiled` leaves the streaming stages alone and
+    only the blocks of :meth:`stage` are recorded.
+    """
+
+    def __init__(self, streams: bool = True) -> None:
+        self.streams = streams
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.groups: List[Dict[str, Any]] = []
+        self._stack: List[str] = []
+        self._mark = time.perf_counter()
+
+    def _record(self, name: str) -> Dict[str, Any]:
+        if name not in self.stages:
+            self.stages[name] = {'stage': name, 'seconds': 0.0, 'features': 0, 'peak_rss': None}
+        return self.stages[name]
+
+    def _enter(self, name: str) -> None:
+        now = time.perf_counter()
+        if self._stack:
+            self.stages[self._stack[-1]]['seconds'] += now - self._mark
+        self._record(name)
+        self._stack.append(name)
+        self._mark = now
+
+    def _leave(self) -> None:
+        now = time.perf_counter()
+        self.stages[self._stack.pop()]['seconds'] += now - self._mark
+        self._mark = now
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, Any]]:
+        """
+        Times the enclosed block; the yielded record's ``features`` can be
+        set by the caller.
+        """
+        self._enter(name)
+        try:
+            yield self.stages[name]
+        finally:
+            self._leave()
+            self.stages[name]['peak_rss'] = peak_rss()
+
+    def stream(self, name: str, features: Iterable) -> Iterator:
+        """
+        Passes ``features`` through, charging the time spent producing them
+        to the ``name`` stage and counting them.
+        """
+        iterator = iter(features)
+        record = self._record(name)
+
+        try:
+            while True:
+                self._enter(name)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self._leave()
+                record['features'] += 1
+                yield item
+        finally:
+            record['peak_rss'] = peak_rss()
+
+    def group(self, name: Any, features: int, seconds: float) -> None:
+        self.groups.append({'group': name, 'features': features, 'seconds': seconds})
+
+    def report(self, feedback: 'QgsFeedback') -> None:
+        for record in self.stages.values():
+            rss = '{:.1f} MiB'.format(record['peak_rss'] / 2 ** 20) if record['peak_rss'] else 'n/a'
+            feedback.pushInfo('{stage}: {seconds:.3f} s, {features} features, peak RSS {rss}'.format(rss=rss,
+                                                                                                   **record))
+
+        if self.groups:
+            feedback.pushInfo('{} line name groups snapped in {:.3f} s'.format(
+                len(self.groups), sum(group['seconds'] for group in self.groups)))
+            for group in sorted(self.groups, key=lambda group: group['seconds'], reverse=True)[:REPORTED_GROUPS]:
+                feedback.pushInfo('  {group}: {seconds:.3f} s, {features} features'.format(**group))
+
+    def save(self, path: str) -> None:
+        """
+        Writes the records to ``path``, as CSV if it ends with .csv and as
+        JSON otherwise.
+        """
+        stages = list(self.stages.values())
+
+        if os.path.splitext(path)[1].lower() == '.csv':
+            with open(path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(['kind', 'name', 'seconds', 'features', 'peak_rss'])
+                for record in stages:
+                    writer.writerow(['stage', record['stage'], record['seconds'], record['features'],
+                                     record['peak_rss']])
+                for group in self.groups:
+                    writer.writerow(['group', group['group'], group['seconds'], group['features'], ''])
+        else:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump({'stages': stages, 'groups': self.groups}, file, indent=2)
+
+
+def profiled(profiler: Optional[Profiler], name: str, features: Iterable) -> Iterable:
+    return profiler.stream(name, features) if profiler is not None and profiler.streams else features
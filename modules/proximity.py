@@ -1,23 +1,44 @@
-from typing import List
+from functools import lru_cache
+from typing import FrozenSet, Sequence, Tuple
 
+# longest substrings compared; comparing all of them cost O(n³) per name pair
+MAX_NGRAM = 3
 
-def proximity(first, second):
-    first = first.lower().strip()
-    second = second.lower().strip()
-    first_set = set()
-    second_set = set()
+# layer schemas and field matches kept in the caches
+CACHE_SIZE = 256
 
-    for j in range(0, len(first)):
-        for i in range(len(first) - j):
-            first_set.add(first[i:i + 1 + j])
 
-    for j in range(0, len(second)):
-        for i in range(len(second) - j):
-            second_set.add(second[i:i + 1 + j])
+@lru_cache(maxsize=CACHE_SIZE * 16)
+def profile(name: str) -> FrozenSet[str]:
+    name = name.lower().strip()
+    return frozenset(name[i:i + n] for n in range(1, MAX_NGRAM + 1) for i in range(len(name) - n + 1))
 
-    return len(first_set & second_set) / len(first_set | second_set)
 
+def similarity(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    union = len(first | second)
+    return len(first & second) / union if union else 0.0
 
-def find_field(sample_field: str, layer_fields: List) -> str:
-    proximity_list = [proximity(sample_field, field) for field in layer_fields]
+
+def proximity(first: str, second: str) -> float:
+    return similarity(profile(first), profile(second))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def schema_profiles(layer_fields: Tuple[str, ...]) -> Tuple[FrozenSet[str], ...]:
+    return tuple(profile(field) for field in layer_fields)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _find_field(sample_field: str, layer_fields: Tuple[str, ...]) -> str:
+    sample = sample_field.lower().strip()
+    for field in layer_fields:
+        if field.lower().strip() == sample:
+            return field
+
+    sample_profile = profile(sample_field)
+    proximity_list = [similarity(sample_profile, field_profile) for field_profile in schema_profiles(layer_fields)]
     return layer_fields[proximity_list.index(max(proximity_list))]
+
+
+def find_field(sample_field: str, layer_fields: Sequence[str]) -> str:
+    return _find_field(sample_field, tuple(layer_fields))
@@ -0,0 +1,48 @@
+import os
+from typing import Iterable, List, Optional
+
+from qgis.core import QgsFeatureSink, QgsFeature, QgsFeedback, QgsProcessingException
+
+# OGR layer creation options of the streaming friendly formats, by destination extension:
+# FlatGeobuf gets its packed Hilbert R-tree, GeoParquet one row group per write batch
+LAYER_OPTIONS = {
+    '.fgb': ['SPATIAL_INDEX=YES'],
+    '.parquet': ['GEOMETRY_ENCODING=WKB', 'ROW_GROUP_SIZE={batch_size}'],
+}
+
+
+def layer_options(destination: str, batch_size: int) -> List[str]:
+    """
+    The layer creation options for an output written to ``destination``.
+    """
+    extension = os.path.splitext(destination or '')[1].lower()
+    return [option.format(batch_size=batch_size) for option in LAYER_OPTIONS.get(extension, [])]
+
+
+def write_features(sink: QgsFeatureSink, features: Iterable[QgsFeature], batch_size: int,
+                   feedback: Optional[QgsFeedback] = None) -> int:
+    """
+    Writes the features to the sink in batches of ``batch_size`` and returns
+    the number of features written.
+    """
+    batch = []
+    count = 0
+
+    for feature in features:
+        batch.append(feature)
+        if len(batch) >= batch_size:
+            count += _flush(sink, batch)
+            batch = []
+            if feedback is not None and feedback.isCanceled():
+                return count
+
+    if batch:
+        count += _flush(sink, batch)
+
+    return count
+
+
+def _flush(sink: QgsFeatureSink, batch: list) -> int:
+    if not sink.addFeatures(batch, QgsFeatureSink.FastInsert):
+        raise QgsProcessingException('Could not write features: {}'.format(sink.lastError()))
+    return len(batch)
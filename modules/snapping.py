@@ -0,0 +1,224 @@
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# the kernels only need NumPy, which keeps them importable (and testable) without QGIS
+if TYPE_CHECKING:
+    from qgis.core import QgsGeometry
+
+from .wkb import wkb_segments
+
+# upper bound of point/segment pairs evaluated in a single vectorized batch
+PAIRS_PER_BATCH = 2 ** 21
+
+
+def project_points(points: np.ndarray, segments: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Projects every point onto the segment paired with it (both arrays have the
+    same length) and returns the projected coordinates with squared distances.
+    """
+    start = segments[:, 0:2]
+    direction = segments[:, 2:4] - start
+    length = np.einsum('ij,ij->i', direction, direction)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        measure = np.einsum('ij,ij->i', points - start, direction) / length
+    measure = np.clip(np.nan_to_num(measure, nan=0.0, posinf=0.0, neginf=0.0), 0.0, 1.0)
+
+    projected = start + direction * measure[:, None]
+    offset = projected - points
+
+    return projected, np.einsum('ij,ij->i', offset, offset)
+
+
+def grid_cells(coordinates: np.ndarray, origin: np.ndarray, cell_size: float) -> np.ndarray:
+    return np.floor((coordinates - origin) / cell_size).astype(np.int64)
+
+
+def register_cells(low_cells: np.ndarray, high_cells: np.ndarray) -> Tuple[int, np.ndarray, np.ndarray]:
+    """
+    Registers every box (given by its lower and upper grid cells) in all the
+    cells it covers. Returns the number of grid rows and the cell ids with
+    the box registered in each, sorted by cell id.
+    """
+    rows = int(high_cells[:, 1].max()) + 1
+
+    spans = high_cells - low_cells + 1
+    counts = spans[:, 0] * spans[:, 1]
+
+    owner = np.repeat(np.arange(len(low_cells)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    column = low_cells[owner, 0] + offset // spans[owner, 1]
+    row = low_cells[owner, 1] + offset % spans[owner, 1]
+
+    cell_ids = column * rows + row
+    order = np.argsort(cell_ids, kind='stable')
+
+    return rows, cell_ids[order], owner[order]
+
+
+def register_segments(segments: np.ndarray, origin: np.ndarray, cell_size: float,
+                      grow: float = 0.0) -> Tuple[int, np.ndarray, np.ndarray]:
+    """
+    Registers every segment in the grid cells it passes through (within
+    ``grow``), like :func:`register_cells`. Segments longer than a cell are
+    cut into cell sized pieces first, so that a long diagonal costs a number
+    of entries proportional to its length and not to its bounding box area.
+    """
+    extent = np.abs(segments[:, 2:4] - segments[:, 0:2]).max(axis=1)
+    pieces = np.maximum(np.ceil(extent / cell_size), 1).astype(np.int64)
+
+    segment = np.repeat(np.arange(len(segments)), pieces)
+    step = np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    start = segments[segment, 0:2]
+    direction = (segments[segment, 2:4] - start) / pieces[segment, None]
+    piece_start = start + direction * step[:, None]
+    piece_end = np.where((step + 1 == pieces[segment])[:, None], segments[segment, 2:4],
+                         start + direction * (step + 1)[:, None])
+
+    low = np.minimum(piece_start, piece_end) - grow
+    high = np.maximum(piece_start, piece_end) + grow
+    rows, cell_ids, owners = register_cells(grid_cells(low, origin, cell_size), grid_cells(high, origin, cell_size))
+
+    # neighbouring pieces share cells, keep every segment once per cell
+    cell_segments = segment[owners]
+    order = np.lexsort((cell_segments, cell_ids))
+    cell_ids, cell_segments = cell_ids[order], cell_segments[order]
+    distinct = np.ones(len(cell_ids), dtype=bool)
+    distinct[1:] = (cell_ids[1:] != cell_ids[:-1]) | (cell_segments[1:] != cell_segments[:-1])
+
+    return rows, cell_ids[distinct], cell_segments[distinct]
+
+
+class SegmentGrid:
+    """
+    Uniform grid over the segments of one line group. Each segment is
+    registered in every cell it passes within the snapping tolerance of (see
+    :func:`register_segments`), so a point only has to look at its own cell.
+
+    When ``owners`` labels the segments, points can be kept from snapping to
+    the segments of their own owner.
+    """
+
+    def __init__(self, segments: np.ndarray, tolerance: float, owners: Optional[np.ndarray] = None) -> None:
+        self.segments = segments
+        self.tolerance = tolerance
+        self.owners = owners
+
+        extent = np.abs(segments[:, 2:4] - segments[:, 0:2]).max(axis=1)
+        self.cell_size = max(tolerance, float(np.median(extent)) if len(extent) else 0.0) or 1.0
+
+        self.origin = np.minimum(segments[:, 0:2], segments[:, 2:4]).min(axis=0) - tolerance
+        self.rows, self.cell_ids, self.cell_segments = register_segments(segments, self.origin, self.cell_size,
+                                                                         tolerance)
+
+    def _cells(self, coordinates: np.ndarray) -> np.ndarray:
+        return grid_cells(coordinates, self.origin, self.cell_size)
+
+    def snap(self, points: np.ndarray, owners: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the snapped copy of ``points`` and a mask of the points that
+        had a segment within tolerance. Points with ``owners`` ignore the
+        segments of the same owner.
+        """
+        snapped, found, _ = self.nearest(points, owners)
+        return snapped, found
+
+    def nearest(self, points: np.ndarray,
+                owners: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Like :meth:`snap`, also returning the index of the segment every
+        point was snapped to (-1 if none).
+        """
+        snapped = points.copy()
+        found = np.zeros(len(points), dtype=bool)
+        nearest = np.full(len(points), -1, dtype=np.int64)
+
+        if not len(points):
+            return snapped, found, nearest
+
+        cells = self._cells(points)
+        inside = (cells >= 0).all(axis=1) & (cells[:, 1] < self.rows)
+        point_cells = np.where(inside, cells[:, 0] * self.rows + cells[:, 1], -1)
+
+        first = np.searchsorted(self.cell_ids, point_cells, side='left')
+        last = np.searchsorted(self.cell_ids, point_cells, side='right')
+        counts = np.where(inside, last - first, 0)
+
+        best = np.full(len(points), np.inf)
+
+        for batch_start, batch_stop in _batches(counts):
+            batch_counts = counts[batch_start:batch_stop]
+            point_index = np.repeat(np.arange(batch_start, batch_stop), batch_counts)
+            if not len(point_index):
+                continue
+            offset = np.arange(len(point_index)) - np.repeat(np.cumsum(batch_counts) - batch_counts, batch_counts)
+            segment_index = self.cell_segments[first[point_index] + offset]
+
+            projected, distance = project_points(points[point_index], self.segments[segment_index])
+            if owners is not None and self.owners is not None:
+                distance[self.owners[segment_index] == owners[point_index]] = np.inf
+
+            # keep the closest candidate per point: sort by point, then by distance
+            order = np.lexsort((distance, point_index))
+            point_index, segment_index = point_index[order], segment_index[order]
+            projected, distance = projected[order], distance[order]
+            leading = np.ones(len(point_index), dtype=bool)
+            leading[1:] = point_index[1:] != point_index[:-1]
+
+            point_index, segment_index = point_index[leading], segment_index[leading]
+            projected, distance = projected[leading], distance[leading]
+            closer = distance < best[point_index]
+            best[point_index[closer]] = distance[closer]
+            snapped[point_index[closer]] = projected[closer]
+            nearest[point_index[closer]] = segment_index[closer]
+
+        found = best <= self.tolerance ** 2
+        snapped[~found] = points[~found]
+        nearest[~found] = -1
+
+        return snapped, found, nearest
+
+
+def _batches(counts: np.ndarray):
+    total = np.cumsum(counts)
+    start = 0
+    while start < len(counts):
+        base = total[start - 1] if start else 0
+        stop = int(np.searchsorted(total, base + PAIRS_PER_BATCH, side='right'))
+        stop = max(stop, start + 1)
+        yield start, stop
+        start = stop
+
+
+def snap_coordinates(line_buffers: List[bytes], coordinates: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Snaps the (n, 2) ``coordinates`` to the closest vertex or segment of the
+    WKB lines within the tolerance and returns the snapped copy.
+    """
+    segments = np.vstack([wkb_segments(buffer) for buffer in line_buffers]) if line_buffers else np.empty((0, 4))
+    if not len(segments) or not len(coordinates):
+        return np.array(coordinates, dtype=float)
+
+    snapped, found = SegmentGrid(segments, tolerance).snap(coordinates)
+    result = np.array(coordinates, dtype=float)
+    result[found] = snapped[found]
+    return result
+
+
+class SegmentIndex:
+    """
+    Lines keyed by line name, kept as WKB buffers so that whole groups can be
+    handed to snapping workers.
+    """
+
+    def __init__(self, tolerance: float) -> None:
+        self.tolerance = tolerance
+        self._lines: Dict[Any, List[bytes]] = {}
+
+    def add_line(self, key: Any, geometry: 'QgsGeometry') -> None:
+        if geometry is not None and not geometry.isNull():
+            self._lines.setdefault(key, []).append(bytes(geometry.asWkb()))
+
+    def lines(self, key: Any) -> List[bytes]:
+        return self._lines.get(key, [])
@@ -0,0 +1,130 @@
+import hashlib
+import sqlite3
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from qgis.core import QgsFeature
+
+from .store import plain_value
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uuids (layer TEXT NOT NULL, digest TEXT NOT NULL, position INTEGER NOT NULL,
+                                  uuid TEXT NOT NULL, PRIMARY KEY (layer, digest, position));
+CREATE TABLE IF NOT EXISTS groups (name TEXT, digest TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS snapped (name TEXT, uuid TEXT NOT NULL, wkb BLOB);
+CREATE INDEX IF NOT EXISTS snapped_name ON snapped (name);
+"""
+
+
+def feature_digest(feature: QgsFeature) -> str:
+    digest = hashlib.sha1()
+    digest.update(bytes(feature.geometry().asWkb()) if feature.hasGeometry() else b'')
+    digest.update(repr([plain_value(value) for value in feature.attributes()]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class StateStore:
+    """
+    Incremental processing state kept in a SQLite file next to the outputs:
+    the uuids given to the source features, keyed by a hash of their content,
+    and the snapped points of every line name group with the digest of the
+    inputs they were computed from.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+        self._uuids: Dict[str, Dict[str, List[str]]] = {}
+        for layer, digest, value in self.connection.execute(
+                'SELECT layer, digest, uuid FROM uuids ORDER BY layer, digest, position'):
+            self._uuids.setdefault(layer, {}).setdefault(digest, []).append(value)
+
+        self._groups: Dict[Optional[str], str] = dict(self.connection.execute('SELECT name, digest FROM groups'))
+
+        self._new_uuids: List[Tuple[str, str, int, str]] = []
+        self._new_groups: Dict[Optional[str], Tuple[str, List[str], List[bytes]]] = {}
+        self._seen_groups: Dict[Optional[str], str] = {}
+
+    def uuid_assigner(self, layer: str) -> Callable[[QgsFeature], str]:
+        """
+        Returns a function giving a source feature of ``layer`` the uuid it
+        had in the previous run, or a new one if its content changed.
+        """
+        previous = self._uuids.get(layer, {})
+        seen: Dict[str, int] = {}
+
+        def assign(feature: QgsFeature) -> str:
+            digest = feature_digest(feature)
+            position = seen.get(digest, 0)
+            seen[digest] = position + 1
+
+            reused = previous.get(digest, [])
+            value = reused[position] if position < len(reused) else str(uuid.uuid4())
+
+            self._new_uuids.append((layer, digest, position, value))
+            return value
+
+        return assign
+
+    def keep_uuids(self, layer: str) -> None:
+        """
+        Keeps the uuids of ``layer`` from the previous run, for a layer whose
+        features were not assigned any in this one.
+        """
+        for digest, values in self._uuids.get(layer, {}).items():
+            self._new_uuids.extend((layer, digest, position, value) for position, value in enumerate(values))
+
+    @staticmethod
+    def group_name(name: Optional[str], scope: Optional[str] = None) -> Optional[str]:
+        """
+        The key a group is stored under: its line name, or the line name
+        within ``scope`` (the tile of tiled runs, which snap every line name
+        once per tile).
+        """
+        return name if scope is None else repr((scope, name))
+
+    @staticmethod
+    def group_digest(line_buffers: Iterable[bytes], point_uuids: Iterable[str], point_buffers: Iterable[bytes],
+                     tolerance: float) -> str:
+        digest = hashlib.sha1(repr(tolerance).encode('utf-8'))
+        for line_hash in sorted(hashlib.sha1(buffer).digest() for buffer in line_buffers):
+            digest.update(line_hash)
+        for point_uuid, buffer in sorted(zip(point_uuids, point_buffers)):
+            digest.update(point_uuid.encode('utf-8'))
+            digest.update(buffer)
+        return digest.hexdigest()
+
+    def snapped_group(self, name: Optional[str], digest: str) -> Optional[Dict[str, bytes]]:
+        """
+        Returns the snapped point geometries (WKB by uuid) stored for the
+        group if it was computed from the same inputs, otherwise None.
+        """
+        self._seen_groups[name] = digest
+        if self._groups.get(name, None) != digest:
+            return None
+
+        return {value: bytes(wkb) for value, wkb in self.connection.execute(
+            'SELECT uuid, wkb FROM snapped WHERE name IS ?', (name,))}
+
+    def store_group(self, name: Optional[str], digest: str, uuids: List[str], buffers: List[bytes]) -> None:
+        self._new_groups[name] = (digest, uuids, buffers)
+
+    def commit(self) -> None:
+        with self.connection:
+            self.connection.execute('DELETE FROM uuids')
+            self.connection.executemany('INSERT INTO uuids VALUES (?, ?, ?, ?)', self._new_uuids)
+
+            for name in set(self._groups) - set(self._seen_groups) | set(self._new_groups):
+                self.connection.execute('DELETE FROM groups WHERE name IS ?', (name,))
+                self.connection.execute('DELETE FROM snapped WHERE name IS ?', (name,))
+
+            for name, (digest, uuids, buffers) in self._new_groups.items():
+                self.connection.execute('INSERT INTO groups VALUES (?, ?)', (name, digest))
+                self.connection.executemany('INSERT INTO snapped VALUES (?, ?, ?)',
+                                            ((name, value, buffer) for value, buffer in zip(uuids, buffers)))
+
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
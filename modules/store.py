@@ -0,0 +1,239 @@
+import struct
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from qgis.core import QgsFeature, QgsFields, QgsGeometry, QgsProcessingException, QgsWkbTypes
+
+from .ordering import spatial_order
+from .wkb import WKB_POINT, wkb_dimensions, wkb_parts
+
+WKB_MULTIPOINT = 4
+
+
+def plain_value(value: Any) -> Any:
+    """
+    None for a NULL attribute (None or a null QVariant), the value itself
+    otherwise.
+    """
+    if value is None or (hasattr(value, 'isNull') and value.isNull()):
+        return None
+    return value
+
+
+class DictionaryColumn:
+    """
+    An attribute column kept as integer codes into the list of its distinct
+    values.
+    """
+
+    def __init__(self) -> None:
+        self.codes = array('i')
+        self.values: List[Any] = []
+        self._lookup: Dict[Any, int] = {}
+
+    def append(self, value: Any) -> None:
+        value = plain_value(value)
+        try:
+            code = self._lookup.get(value)
+        except TypeError:
+            # unhashable values (lists, maps) are kept as they are
+            code = None
+        else:
+            if code is None:
+                self._lookup[value] = len(self.values)
+
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def codes_array(self) -> np.ndarray:
+        return np.frombuffer(self.codes, dtype=np.int32) if len(self.codes) else np.empty(0, dtype=np.int32)
+
+
+class FeatureStore:
+    """
+    Compact in-memory copy of (multi)point features: the vertices of all of
+    them in one contiguous coordinate array with per feature offsets, the
+    attributes as dictionary encoded columns. Features are only rebuilt on
+    the way to the sinks, see :meth:`features`.
+
+    Every geometry is kept with the Z and M values of the layer type: the
+    missing ones are set to 0, the extra ones dropped.
+    """
+
+    def __init__(self, fields: QgsFields, wkb_type: QgsWkbTypes.Type) -> None:
+        self.fields = fields
+        self.has_z = bool(QgsWkbTypes.hasZ(wkb_type))
+        self.has_m = bool(QgsWkbTypes.hasM(wkb_type))
+        self.dimensions = 2 + self.has_z + self.has_m
+        self.columns = [DictionaryColumn() for _ in range(fields.count())]
+
+        self._coordinates = array('d')
+        self._offsets = array('q', [0])
+        self._types = array('I')
+        self._fids = array('q')
+
+    def __len__(self) -> int:
+        return len(self._fids)
+
+    def append(self, feature: QgsFeature) -> None:
+        attributes = feature.attributes()
+        for column, value in zip(self.columns, attributes):
+            column.append(value)
+        for column in self.columns[len(attributes):]:
+            column.append(None)
+
+        wkb_type = 0
+        if feature.hasGeometry():
+            buffer = bytes(feature.geometry().asWkb())
+            (wkb_type,) = struct.unpack_from('<I' if buffer[0] == 1 else '>I', buffer, 1)
+            base_type = (wkb_type & 0x0FFFFFFF) % 1000
+            if base_type not in (WKB_POINT, WKB_MULTIPOINT):
+                raise QgsProcessingException('Point geometries expected, got WKB type {}'.format(wkb_type))
+            has_z, has_m = wkb_dimensions(wkb_type)
+            for part in wkb_parts(buffer):
+                self._coordinates.extend(self._conform(part, has_z, has_m).ravel().tolist())
+            wkb_type = base_type + 1000 * self.has_z + 2000 * self.has_m
+
+        self._types.append(wkb_type)
+        self._offsets.append(len(self._coordinates) // self.dimensions)
+        self._fids.append(feature.id())
+
+    def _conform(self, part: np.ndarray, has_z: bool, has_m: bool) -> np.ndarray:
+        # the values are laid out x, y[, z][, m] both in the part and in the store
+        rows = np.zeros((len(part), self.dimensions))
+        rows[:, :2] = part[:, :2]
+        if self.has_z and has_z:
+            rows[:, 2] = part[:, 2]
+        if self.has_m and has_m:
+            rows[:, -1] = part[:, -1]
+        return rows
+
+    def collect(self, features: Iterable[QgsFeature]) -> Iterator[QgsFeature]:
+        """
+        Passes the features through, keeping a copy of each in the store.
+        """
+        for feature in features:
+            self.append(feature)
+            yield feature
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        return np.frombuffer(self._coordinates, dtype=float).reshape(-1, self.dimensions) \
+            if len(self._coordinates) else np.empty((0, self.dimensions))
+
+    @property
+    def offsets(self) -> np.ndarray:
+        return np.frombuffer(self._offsets, dtype=np.int64)
+
+    def vertices(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Indices into :attr:`coordinates` of the vertices of the ``ids``
+        features, in order.
+        """
+        offsets = self.offsets
+        starts = offsets[ids]
+        counts = offsets[ids + 1] - starts
+        return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+    def first_vertices(self) -> np.ndarray:
+        """
+        The x, y of the first vertex of every feature, NaN for the features
+        without geometry.
+        """
+        offsets = self.offsets
+        xy = np.full((len(self), 2), np.nan)
+        present = offsets[1:] > offsets[:-1]
+        xy[present] = self.coordinates[offsets[:-1][present], :2]
+        return xy
+
+    def groups(self, name_index: int, uuid_index: int, key=None, order=None,
+               spatial: bool = False) -> List[Tuple[Any, np.ndarray]]:
+        """
+        The feature ids of every value of the ``name_index`` column, each
+        sorted by the ``uuid_index`` column, or along a Hilbert curve if
+        ``spatial``. ``key`` maps the column values to group keys, ``order``
+        sorts the keys.
+        """
+        names = self.columns[name_index]
+        uuids = self.columns[uuid_index]
+
+        value_keys = [key(value) if key is not None else value for value in names.values]
+        keys = sorted(set(value_keys), key=order)
+        key_rank = {group: rank for rank, group in enumerate(keys)}
+
+        feature_rank = np.array([key_rank[group] for group in value_keys], dtype=np.int64)[names.codes_array()] \
+            if len(self) else np.empty(0, dtype=np.int64)
+        if spatial:
+            ordered = spatial_order(feature_rank, self.first_vertices())
+        else:
+            uuid_rank = np.argsort(np.argsort(np.array([str(value) for value in uuids.values], dtype=object),
+                                              kind='stable'))
+            feature_uuid = uuid_rank[uuids.codes_array()] if len(self) else np.empty(0, dtype=np.int64)
+            ordered = np.lexsort((feature_uuid, feature_rank))
+        bounds = np.searchsorted(feature_rank[ordered], np.arange(len(keys) + 1))
+
+        return [(group, ordered[bounds[rank]:bounds[rank + 1]]) for rank, group in enumerate(keys)]
+
+    def values(self, index: int, ids: np.ndarray) -> List[Any]:
+        column = self.columns[index]
+        codes = column.codes_array()[ids]
+        return [column.values[code] for code in codes.tolist()]
+
+    def wkb(self, ids: np.ndarray, xy: Optional[np.ndarray] = None) -> List[bytes]:
+        """
+        WKB geometries of the ``ids`` features (empty for no geometry), with
+        the x, y of their vertices replaced by ``xy`` if given (one row per
+        vertex of :meth:`vertices`).
+        """
+        coordinates = self.coordinates[self.vertices(ids)]
+        if xy is not None:
+            coordinates = coordinates.copy()
+            coordinates[:, :2] = xy
+
+        offsets = self.offsets
+        buffers = []
+        position = 0
+        for fid in ids.tolist():
+            count = int(offsets[fid + 1] - offsets[fid])
+            rows = coordinates[position:position + count]
+            position += count
+
+            wkb_type = self._types[fid]
+            if not wkb_type:
+                buffers.append(b'')
+            elif (wkb_type & 0x0FFFFFFF) % 1000 == WKB_MULTIPOINT:
+                header = struct.pack('<BI', 1, wkb_type - 3)
+                buffers.append(struct.pack('<BII', 1, wkb_type, count)
+                               + b''.join(header + row.tobytes() for row in rows))
+            else:
+                buffers.append(struct.pack('<BI', 1, wkb_type) + rows.tobytes())
+
+        return buffers
+
+    def sorted_features(self, groups: List[Tuple[Any, np.ndarray]]) -> Iterator[QgsFeature]:
+        """
+        Rebuilds all the features of ``groups`` (see :meth:`groups`) in order.
+        """
+        for _, ids in groups:
+            yield from self.features(ids, self.wkb(ids))
+
+    def features(self, ids: np.ndarray, buffers: List[bytes]) -> Iterator[QgsFeature]:
+        """
+        Rebuilds the ``ids`` features with the given WKB geometries.
+        """
+        codes = [column.codes_array()[ids].tolist() for column in self.columns]
+        fids = np.frombuffer(self._fids, dtype=np.int64)[ids].tolist()
+
+        for position, (fid, buffer) in enumerate(zip(fids, buffers)):
+            feature = QgsFeature(self.fields, fid)
+            feature.setAttributes([column.values[column_codes[position]]
+                                   for column, column_codes in zip(self.columns, codes)])
+            if buffer:
+                geometry = QgsGeometry()
+                geometry.fromWkb(buffer)
+                feature.setGeometry(geometry)
+            yield feature
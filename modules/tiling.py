@@ -0,0 +1,234 @@
+import math
+import os
+import shutil
+import uuid
+from typing import Callable, Dict, Iterator, Optional, Set
+
+from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransformContext, QgsFeature,
+                       QgsFeatureRequest, QgsFeatureSink, QgsFeatureSource, QgsFeedback, QgsFields,
+                       QgsGeometry, QgsPointXY, QgsProcessingException, QgsRectangle, QgsVectorFileWriter,
+                       QgsVectorLayer, QgsWkbTypes)
+
+from .grouping import group_key, snap_point_groups
+from .pipeline import SECOND_SUFFIX, UUID_FIELD, build_network, random_uuids, tag_uuid
+from .sinks import write_features
+from .snapping import SegmentIndex
+from .state import StateStore
+from .store import FeatureStore
+
+
+def tiles(extent: QgsRectangle, size: float) -> Iterator[QgsRectangle]:
+    """
+    Square tiles of ``size`` covering ``extent``. The tiles overhang the
+    extent so that every point of it falls in exactly one half-open tile.
+    """
+    columns = int(math.floor(extent.width() / size)) + 1
+    rows = int(math.floor(extent.height() / size)) + 1
+
+    for column in range(columns):
+        for row in range(rows):
+            x = extent.xMinimum() + column * size
+            y = extent.yMinimum() + row * size
+            yield QgsRectangle(x, y, x + size, y + size)
+
+
+def owns(tile: QgsRectangle, point: Optional[QgsPointXY]) -> bool:
+    return point is not None and tile.xMinimum() <= point.x() < tile.xMaximum() \
+        and tile.yMinimum() <= point.y() < tile.yMaximum()
+
+
+def anchor(geometry: QgsGeometry) -> Optional[QgsPointXY]:
+    """
+    The point deciding which tile a feature belongs to: its first vertex.
+    """
+    if geometry.isNull() or geometry.isEmpty():
+        return None
+    return QgsPointXY(geometry.vertexAt(0))
+
+
+def grown(rectangle: QgsRectangle, distance: float) -> QgsRectangle:
+    result = QgsRectangle(rectangle)
+    result.grow(distance)
+    return result
+
+
+class SpillStore:
+    """
+    On-disk GeoPackage layers holding the per tile results until they are
+    stitched into the outputs.
+    """
+
+    def __init__(self, directory: str, transform_context: QgsCoordinateTransformContext) -> None:
+        self.directory = os.path.join(directory, 'snapper_{}'.format(uuid.uuid4().hex))
+        os.makedirs(self.directory)
+        self.transform_context = transform_context
+        self._writers: Dict[str, QgsVectorFileWriter] = {}
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, '{}.gpkg'.format(name))
+
+    def create(self, name: str, fields: QgsFields, wkb_type: QgsWkbTypes.Type,
+               crs: QgsCoordinateReferenceSystem) -> QgsVectorFileWriter:
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = 'GPKG'
+        options.layerName = name
+
+        writer = QgsVectorFileWriter.create(self.path(name), fields, wkb_type, crs, self.transform_context, options)
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise QgsProcessingException('Could not create spill layer {}: {}'.format(name, writer.errorMessage()))
+
+        self._writers[name] = writer
+        return writer
+
+    def layer(self, name: str) -> QgsVectorLayer:
+        writer = self._writers.pop(name, None)
+        if writer is not None:
+            writer.flushBuffer()
+            del writer
+        layer = QgsVectorLayer(self.path(name), name, 'ogr')
+        if not layer.isValid():
+            raise QgsProcessingException('Could not read spill layer {} of {}'.format(name, self.path(name)))
+        return layer
+
+    def remove(self) -> None:
+        """
+        Deletes the spill directory once the outputs are written. Files
+        still held open by a layer (on Windows) are left behind.
+        """
+        for writer in self._writers.values():
+            writer.flushBuffer()
+        self._writers.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _tee(features: Iterator[QgsFeature], sink: QgsFeatureSink, batch_size: int) -> Iterator[QgsFeature]:
+    batch = []
+    for feature in features:
+        batch.append(feature)
+        if len(batch) >= batch_size:
+            write_features(sink, batch, batch_size)
+            batch = []
+        yield feature
+    write_features(sink, batch, batch_size)
+
+
+def _null_geometries(source: QgsFeatureSource) -> Iterator[QgsFeature]:
+    for feature in source.getFeatures(QgsFeatureRequest().setFilterExpression('$geometry IS NULL')):
+        yield feature
+
+
+def process_canal_tiles(source: QgsFeatureSource, fields: QgsFields, tile_size: float, buffer: float,
+                        tolerance: float, spill: SpillStore, canals_sink: QgsFeatureSink,
+                        intersection_fields: QgsFields, name_field: str, type_field: str, type_value: str,
+                        batch_size: int, assign: Optional[Callable[[QgsFeature], str]] = None,
+                        feedback: Optional[QgsFeedback] = None) -> None:
+    """
+    Runs the line pipeline tile by tile. A line belongs to the tile holding
+    its first vertex and is processed together with every line around it
+    (within ``buffer``). Its pieces are written to ``canals_sink`` and to the
+    ``canals`` spill layer. A crossing goes to the ``intersections`` spill
+    layer from the tile owning one of its two lines (the one with the smaller
+    uuid), so crossings in tiles where no line starts are not lost.
+    """
+    crs = source.sourceCrs()
+    uuid_index = fields.indexFromName(UUID_FIELD)
+    crossing_uuid_index = intersection_fields.indexFromName(UUID_FIELD)
+    second_uuid_index = intersection_fields.indexFromName(UUID_FIELD + SECOND_SUFFIX)
+
+    # uuids are fixed up front so that a line gets the same one in every tile it is loaded in
+    if assign is None:
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setNoAttributes()
+        uuids = {feature.id(): value for feature, value in zip(source.getFeatures(request), random_uuids())}
+    else:
+        uuids = {feature.id(): assign(feature) for feature in source.getFeatures()}
+
+    spill_canals = spill.create('canals', fields, QgsWkbTypes.multiType(source.wkbType()), crs)
+    spill_intersections = spill.create('intersections', intersection_fields, QgsWkbTypes.Point, crs)
+
+    extent = source.sourceExtent()
+    tile_list = list(tiles(extent, tile_size)) if not extent.isNull() else []
+    total = 100.0 / len(tile_list) if tile_list else 0
+
+    for current, tile in enumerate(tile_list):
+        if feedback is not None:
+            if feedback.isCanceled():
+                return
+            feedback.setProgress(current * total)
+
+        owned: Set[str] = set()
+        context_extent = QgsRectangle()
+        request = QgsFeatureRequest().setFilterRect(tile).setNoAttributes()
+        for feature in source.getFeatures(request):
+            if owns(tile, anchor(feature.geometry())):
+                owned.add(uuids[feature.id()])
+                context_extent.combineExtentWith(feature.geometry().boundingBox())
+
+        if not owned:
+            continue
+
+        network = build_network(source.getFeatures(QgsFeatureRequest().setFilterRect(grown(context_extent, buffer))),
+                                fields, tolerance, assign=lambda feature: uuids[feature.id()])
+
+        pieces = (piece for piece in network.split() if piece.attributes()[uuid_index] in owned)
+        write_features(spill_canals, _tee(pieces, canals_sink, batch_size), batch_size)
+
+        # a crossing belongs to the tile owning the smaller uuid of its two lines, wherever it lies
+        crossings = (point for point in network.intersections(intersection_fields, name_field, type_field, type_value)
+                     if min(str(point.attributes()[crossing_uuid_index]),
+                            str(point.attributes()[second_uuid_index])) in owned)
+        write_features(spill_intersections, crossings, batch_size)
+
+    nulls = tag_uuid(_null_geometries(source), fields, lambda feature: uuids[feature.id()])
+    write_features(spill_canals, _tee(nulls, canals_sink, batch_size), batch_size)
+
+
+def process_point_tiles(source: QgsFeatureSource, fields: QgsFields, tile_size: float, tolerance: float,
+                        lines: QgsVectorLayer, lines_name_field: str, points_name_field: str,
+                        spill: SpillStore, points_sink: QgsFeatureSink, batch_size: int, workers: int,
+                        assign: Optional[Callable[[QgsFeature], str]] = None,
+                        state: Optional[StateStore] = None,
+                        feedback: Optional[QgsFeedback] = None,
+                        spatial: bool = False) -> None:
+    """
+    Snaps the points tile by tile against the lines of the ``canals`` spill
+    layer lying within the tolerance of the tile. The tagged points go to
+    ``points_sink``, the snapped ones to the ``points`` spill layer.
+    """
+    spill_points = spill.create('points', fields, source.wkbType(), source.sourceCrs())
+
+    name_index = fields.indexFromName(points_name_field)
+    lines_name_index = lines.fields().indexFromName(lines_name_field)
+    uuid_index = fields.indexFromName(UUID_FIELD)
+
+    extent = source.sourceExtent()
+    tile_list = list(tiles(extent, tile_size)) if not extent.isNull() else []
+    total = 100.0 / len(tile_list) if tile_list else 0
+
+    for current, tile in enumerate(tile_list):
+        if feedback is not None:
+            if feedback.isCanceled():
+                return
+            feedback.setProgress(current * total)
+
+        owned = (feature for feature in source.getFeatures(QgsFeatureRequest().setFilterRect(tile))
+                 if owns(tile, anchor(feature.geometry())))
+
+        point_store = FeatureStore(fields, source.wkbType())
+        write_features(points_sink, point_store.collect(tag_uuid(owned, fields, assign)), batch_size)
+        if not len(point_store):
+            continue
+
+        lines_by_name = SegmentIndex(tolerance)
+        # the lines come reprojected to the points CRS, the filter rectangle being in that CRS too
+        request = QgsFeatureRequest().setFilterRect(grown(tile, tolerance)) \
+            .setDestinationCrs(source.sourceCrs(), spill.transform_context)
+        for line in lines.getFeatures(request):
+            lines_by_name.add_line(group_key(line.attributes()[lines_name_index]), line.geometry())
+
+        write_features(spill_points,
+                       snap_point_groups(point_store, name_index, lines_by_name, uuid_index, workers, state=state,
+                                         spatial=spatial, scope=tile.toString(17)),
+                       batch_size)
+
+    write_features(spill_points, _tee(tag_uuid(_null_geometries(source), fields, assign), points_sink, batch_size),
+                   batch_size)
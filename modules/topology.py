@@ -0,0 +1,181 @@
+import os
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# the graph build only needs NumPy, which keeps it importable (and testable) without QGIS
+if TYPE_CHECKING:
+    from qgis.core import QgsCoordinateTransform, QgsFeature
+
+from .endpoints import line_ends, neighbour_pairs, union_find
+from .snapping import SegmentGrid
+from .wkb import wkb_parts
+
+
+class TopologyBuilder:
+    """
+    Collects the split lines and the snapped delivery points and exports
+    them as a compact graph for network analysis:
+
+    * ``node_xy``: (n, 2) node coordinates, the line piece ends merged when
+      they lie within ``node_distance`` of each other;
+    * ``edge_nodes``, ``edge_length``, ``edge_name``, ``edge_uuid``: one edge
+      per line part, its from/to nodes, length, line name id and line uuid;
+    * ``csr_indptr``, ``csr_nodes``, ``csr_edges``: the undirected adjacency
+      in CSR form, the neighbours of node ``i`` being
+      ``csr_nodes[csr_indptr[i]:csr_indptr[i + 1]]``, reached by the edges
+      at the same positions of ``csr_edges``;
+    * ``names``: the line names, indexed by the name ids (-1 for no name);
+    * ``point_uuid``, ``point_name``, ``point_xy``, ``point_edge``,
+      ``point_measure``: the delivery points with the edge of their line
+      they are attached to (-1 if none within ``tolerance``) and their
+      distance from the start of that edge.
+
+    Everything is in the CRS of the points, the lines being reprojected with
+    ``line_transform``. ``key`` maps the name values to the keys lines and
+    points are matched by (None for no name).
+    """
+
+    def __init__(self, line_name_index: int, line_uuid_index: int, point_name_index: int, point_uuid_index: int,
+                 tolerance: float, node_distance: float,
+                 line_transform: Optional['QgsCoordinateTransform'] = None,
+                 key: Optional[Callable[[Any], Any]] = None) -> None:
+        self.line_name_index = line_name_index
+        self.line_uuid_index = line_uuid_index
+        self.point_name_index = point_name_index
+        self.point_uuid_index = point_uuid_index
+        self.tolerance = tolerance
+        self.node_distance = node_distance
+        self.key = key
+        self.line_transform = line_transform \
+            if line_transform is not None and not line_transform.isShortCircuited() else None
+
+        self._names: Dict[Any, int] = {}
+        self._line_buffers: List[bytes] = []
+        self._line_names: List[int] = []
+        self._line_uuids: List[str] = []
+        self._point_xy: List[List[float]] = []
+        self._point_names: List[int] = []
+        self._point_uuids: List[str] = []
+
+    def _name_id(self, value: Any) -> int:
+        key = self.key(value) if self.key is not None else value
+        if key is None:
+            return -1
+        return self._names.setdefault(key, len(self._names))
+
+    def add_line(self, feature: 'QgsFeature') -> None:
+        if not feature.hasGeometry():
+            return
+        attributes = feature.attributes()
+        geometry = feature.geometry()
+        if self.line_transform is not None:
+            geometry.transform(self.line_transform)
+        self._line_buffers.append(bytes(geometry.asWkb()))
+        self._line_names.append(self._name_id(attributes[self.line_name_index]))
+        self._line_uuids.append(str(attributes[self.line_uuid_index]))
+
+    def add_point(self, feature: 'QgsFeature') -> None:
+        if not feature.hasGeometry():
+            return
+        attributes = feature.attributes()
+        for part in wkb_parts(bytes(feature.geometry().asWkb())):
+            self._point_xy.extend(part[:, :2].tolist())
+            self._point_names.extend([self._name_id(attributes[self.point_name_index])] * len(part))
+            self._point_uuids.extend([str(attributes[self.point_uuid_index])] * len(part))
+
+    def lines(self, features: Iterable['QgsFeature']) -> Iterator['QgsFeature']:
+        for feature in features:
+            self.add_line(feature)
+            yield feature
+
+    def points(self, features: Iterable['QgsFeature']) -> Iterator['QgsFeature']:
+        for feature in features:
+            self.add_point(feature)
+            yield feature
+
+    def build(self) -> Dict[str, np.ndarray]:
+        coordinates, owners, parts = line_ends(self._line_buffers)
+        line_names = np.array(self._line_names, dtype=np.int32).reshape(-1)
+        line_uuids = np.array(self._line_uuids, dtype='U').reshape(-1)
+
+        # nodes: the part ends, merged
+        labels = union_find(neighbour_pairs(coordinates, self.node_distance), len(coordinates))
+        roots, end_nodes = np.unique(labels, return_inverse=True)
+        edge_nodes = end_nodes.reshape(-1, 2)
+
+        segments = [np.hstack((part[:-1, :2], part[1:, :2])).astype(float) for part in parts]
+        segment_lengths = [np.hypot(part[:, 2] - part[:, 0], part[:, 3] - part[:, 1]) for part in segments]
+        edge_length = np.array([lengths.sum() for lengths in segment_lengths])
+        edge_owner = owners[::2]
+
+        # undirected CSR adjacency
+        sources = np.concatenate((edge_nodes[:, 0], edge_nodes[:, 1]))
+        targets = np.concatenate((edge_nodes[:, 1], edge_nodes[:, 0]))
+        entry_edges = np.tile(np.arange(len(edge_nodes)), 2)
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(len(roots) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(roots)), out=indptr[1:])
+
+        result = {
+            'node_xy': coordinates[roots] if len(roots) else np.empty((0, 2)),
+            'edge_nodes': edge_nodes.astype(np.int64),
+            'edge_length': edge_length,
+            'edge_name': line_names[edge_owner] if len(edge_owner) else np.empty(0, dtype=np.int32),
+            'edge_uuid': line_uuids[edge_owner] if len(edge_owner) else np.empty(0, dtype='U36'),
+            'csr_indptr': indptr,
+            'csr_nodes': targets[order].astype(np.int64),
+            'csr_edges': entry_edges[order].astype(np.int64),
+            'names': np.array([str(name) for name in self._names], dtype='U').reshape(-1),
+        }
+        result.update(self._attach_points(segments, segment_lengths, result['edge_name']))
+        return result
+
+    def _attach_points(self, segments: List[np.ndarray], segment_lengths: List[np.ndarray],
+                       edge_names: np.ndarray) -> Dict[str, np.ndarray]:
+        point_xy = np.array(self._point_xy, dtype=float).reshape(-1, 2)
+        point_names = np.array(self._point_names, dtype=np.int32).reshape(-1)
+        point_edge = np.full(len(point_xy), -1, dtype=np.int64)
+        point_measure = np.full(len(point_xy), np.nan)
+
+        if segments:
+            all_segments = np.vstack(segments)
+            segment_edges = np.repeat(np.arange(len(segments)), [len(part) for part in segments])
+            # distance from the start of the edge to the start of every segment
+            segment_offsets = np.concatenate([np.cumsum(lengths) - lengths for lengths in segment_lengths])
+            segment_names = edge_names[segment_edges]
+
+            # a point only attaches to the lines of its own name
+            for name in np.unique(point_names).tolist():
+                if name < 0:
+                    continue
+                point_index = np.flatnonzero(point_names == name)
+                segment_index = np.flatnonzero(segment_names == name)
+                if not len(segment_index):
+                    continue
+
+                grid = SegmentGrid(all_segments[segment_index], self.tolerance)
+                snapped, found, nearest = grid.nearest(point_xy[point_index])
+                hit = segment_index[nearest[found]]
+                along = np.hypot(snapped[found, 0] - all_segments[hit, 0], snapped[found, 1] - all_segments[hit, 1])
+
+                point_edge[point_index[found]] = segment_edges[hit]
+                point_measure[point_index[found]] = segment_offsets[hit] + along
+
+        return {
+            'point_uuid': np.array(self._point_uuids, dtype='U').reshape(-1),
+            'point_name': point_names,
+            'point_xy': point_xy,
+            'point_edge': point_edge,
+            'point_measure': point_measure,
+        }
+
+    def save(self, directory: str) -> None:
+        """
+        Writes every array to ``<directory>/<name>.npy``. The files load
+        without pickling and can be memory-mapped
+        (``numpy.load(path, mmap_mode='r')``), unlike an ``.npz`` archive.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, array in self.build().items():
+            np.save(os.path.join(directory, '{}.npy'.format(name)), np.ascontiguousarray(array), allow_pickle=False)
@@ -0,0 +1,89 @@
+import struct
+from typing import List, Tuple, Union
+
+import numpy as np
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+WKB_POINT = 1
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+
+EWKB_Z = 0x80000000
+EWKB_M = 0x40000000
+EWKB_SRID = 0x20000000
+
+
+def wkb_dimensions(geometry_type: int) -> Tuple[bool, bool]:
+    """
+    Whether an ISO or EWKB geometry type has Z and M values.
+    """
+    iso_dimension = (geometry_type & 0x0FFFFFFF) // 1000
+    return (iso_dimension in (1, 3) or bool(geometry_type & EWKB_Z),
+            iso_dimension in (2, 3) or bool(geometry_type & EWKB_M))
+
+
+def _read(buffer: Buffer, position: int, parts: List[np.ndarray]) -> int:
+    endian = '<' if buffer[position] == 1 else '>'
+    (geometry_type,) = struct.unpack_from(endian + 'I', buffer, position + 1)
+    position += 5
+
+    if geometry_type & EWKB_SRID:
+        position += 4
+
+    base_type = (geometry_type & 0x0FFFFFFF) % 1000
+    has_z, has_m = wkb_dimensions(geometry_type)
+    dimensions = 2 + has_z + has_m
+    dtype = np.dtype(endian + 'f8')
+
+    if base_type == WKB_POINT:
+        parts.append(np.frombuffer(buffer, dtype, dimensions, position).reshape(1, dimensions))
+        return position + 8 * dimensions
+
+    (count,) = struct.unpack_from(endian + 'I', buffer, position)
+    position += 4
+
+    if base_type == WKB_LINESTRING:
+        parts.append(np.frombuffer(buffer, dtype, count * dimensions, position).reshape(count, dimensions))
+        return position + 8 * dimensions * count
+
+    if base_type == WKB_POLYGON:
+        for _ in range(count):
+            (points,) = struct.unpack_from(endian + 'I', buffer, position)
+            position += 4
+            parts.append(np.frombuffer(buffer, dtype, points * dimensions, position).reshape(points, dimensions))
+            position += 8 * dimensions * points
+        return position
+
+    if base_type in (4, 5, 6, 7):
+        for _ in range(count):
+            position = _read(buffer, position, parts)
+        return position
+
+    raise ValueError('Unsupported WKB geometry type {}'.format(geometry_type))
+
+
+def wkb_parts(buffer: Buffer) -> List[np.ndarray]:
+    """
+    Returns the vertices of every simple part (points, linestrings, rings) of
+    a WKB geometry as (n, dimensions) arrays. The arrays are views over
+    ``buffer``, so they are writable when ``buffer`` is a bytearray.
+    """
+    parts: List[np.ndarray] = []
+    if buffer:
+        _read(buffer, 0, parts)
+    return parts
+
+
+def wkb_segments(buffer: Buffer) -> np.ndarray:
+    """
+    Returns the segments of a WKB (multi)line as an (n, 4) array of
+    x0, y0, x1, y1 rows.
+    """
+    segments = [np.hstack((part[:-1, :2], part[1:, :2])) for part in wkb_parts(buffer) if len(part) > 1]
+
+    if not segments:
+        return np.empty((0, 4))
+
+    return np.vstack(segments)
+
@@ -10,6 +10,7 @@ __revision__ = '$Format:%H$'
 
 from PyQt5.QtGui import QIcon
 from qgis.core import QgsProcessingProvider
+from .algorithms.batch_alg.batch_alg import BatchProcess
 from .algorithms.main_alg.main_alg import Process
 
 
@@ -38,6 +39,7 @@ class snapperProvider(QgsProcessingProvider):
         Loads all algorithms belonging to this provider.
         """
         self.addAlgorithm(Process(self.plugin_dir))
+        self.addAlgorithm(BatchProcess(self.plugin_dir))
         # add additional algorithms here
         # self.addAlgorithm(MyOtherAlgorithm())
 
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# the plugin folder is not an installed package: make its modules importable as ``modules``
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def qgis_application():
+    """
+    An initialised QGIS application, for the tests using data providers
+    (memory and GeoPackage layers). Skips the test without QGIS.
+    """
+    qgis_core = pytest.importorskip('qgis.core')
+    application = qgis_core.QgsApplication([], False)
+    application.initQgis()
+    yield application
+    application.exitQgis()
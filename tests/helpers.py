@@ -0,0 +1,59 @@
+import struct
+from typing import Iterable, Tuple
+
+import numpy as np
+
+
+class Feature:
+    """
+    The parts of a QgsFeature the kernels read.
+    """
+
+    def __init__(self, buffer: bytes, *attributes) -> None:
+        self.buffer = bytes(buffer)
+        self._attributes = list(attributes)
+
+    def hasGeometry(self) -> bool:
+        return True
+
+    def geometry(self) -> 'Feature':
+        return self
+
+    def asWkb(self) -> bytes:
+        return self.buffer
+
+    def attributes(self) -> list:
+        return self._attributes
+
+
+def point(x: float, y: float) -> bytes:
+    return struct.pack('<BIdd', 1, 1, x, y)
+
+
+def linestring(*points: Tuple[float, float]) -> bytearray:
+    return bytearray(struct.pack('<BII', 1, 2, len(points)) + np.array(points, dtype=float).tobytes())
+
+
+def brute_nearest(points: np.ndarray, segments: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Closest point of every segment to every point, the reference for the
+    grid searches: returns the closest projections and squared distances.
+    """
+    start = segments[None, :, 0:2]
+    direction = segments[None, :, 2:4] - start
+    length = (direction ** 2).sum(axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        measure = ((points[:, None, :] - start) * direction).sum(axis=2) / length
+    measure = np.clip(np.nan_to_num(measure), 0.0, 1.0)
+    projected = start + direction * measure[:, :, None]
+    distance = ((projected - points[:, None, :]) ** 2).sum(axis=2)
+
+    best = distance.argmin(axis=1)
+    rows = np.arange(len(points))
+    return projected[rows, best], distance[rows, best]
+
+
+def brute_pairs(coordinates: np.ndarray, distance: float) -> Iterable[Tuple[int, int]]:
+    delta = coordinates[:, None, :] - coordinates[None, :, :]
+    close = (delta ** 2).sum(axis=2) <= distance ** 2
+    return {(first, second) for first, second in zip(*np.nonzero(np.triu(close, 1)))}
@@ -0,0 +1,77 @@
+import numpy as np
+
+from modules.crossings import candidate_pairs, segment_crossings
+
+
+def _brute_crossings(segments: np.ndarray, owners: np.ndarray):
+    result = set()
+    for first in range(len(segments)):
+        for second in range(first + 1, len(segments)):
+            if owners[first] == owners[second]:
+                continue
+            start, direction = segments[first, :2], segments[first, 2:] - segments[first, :2]
+            other, other_direction = segments[second, :2], segments[second, 2:] - segments[second, :2]
+            denominator = direction[0] * other_direction[1] - direction[1] * other_direction[0]
+            if denominator == 0:
+                continue
+            offset = other - start
+            measure = (offset[0] * other_direction[1] - offset[1] * other_direction[0]) / denominator
+            other_measure = (offset[0] * direction[1] - offset[1] * direction[0]) / denominator
+            if 0 <= measure <= 1 and 0 <= other_measure <= 1:
+                x, y = start + measure * direction
+                pair = sorted((int(owners[first]), int(owners[second])))
+                result.add((pair[0], pair[1], round(x, 6), round(y, 6)))
+    return result
+
+
+def _as_set(owner_pairs: np.ndarray, points: np.ndarray):
+    return {(first, second, round(x, 6), round(y, 6))
+            for (first, second), (x, y) in zip(owner_pairs.tolist(), points.tolist())}
+
+
+def test_crossings_match_brute_force():
+    rng = np.random.default_rng(3)
+
+    for _ in range(20):
+        segments, owners = [], []
+        for owner in range(rng.integers(2, 25)):
+            vertices = np.cumsum(rng.normal(size=(rng.integers(2, 8), 2)), axis=0) + rng.random(2) * 10
+            segments.append(np.hstack((vertices[:-1], vertices[1:])))
+            owners += [owner] * (len(vertices) - 1)
+        segments, owners = np.vstack(segments), np.array(owners)
+
+        owner_pairs, points = segment_crossings(segments, owners)
+
+        assert len(owner_pairs) == len(_as_set(owner_pairs, points))
+        assert _as_set(owner_pairs, points) == _brute_crossings(segments, owners)
+
+
+def test_crossing_at_shared_vertex_is_reported_once():
+    segments = np.array([[0.0, 0.0, 1.0, 1.0], [1.0, 1.0, 2.0, 0.0], [0.0, 2.0, 2.0, 0.0]])
+    owner_pairs, points = segment_crossings(segments, np.array([0, 0, 1]))
+
+    assert owner_pairs.tolist() == [[0, 1]]
+    np.testing.assert_allclose(points, [[1.0, 1.0]])
+
+
+def test_long_segment_among_short_ones():
+    rng = np.random.default_rng(0)
+    starts = rng.random((300, 2)) * 30
+    short = np.hstack((starts, starts + [0.5, -0.5]))
+    segments = np.vstack((short, [[0.0, 0.0, 30.0, 30.0]]))
+    owners = np.arange(len(segments))
+
+    owner_pairs, points = segment_crossings(segments, owners)
+
+    expected = {pair for pair in _brute_crossings(segments, owners) if pair[1] == len(short)}
+    assert {crossing for crossing in _as_set(owner_pairs, points) if crossing[1] == len(short)} == expected
+    assert len(expected) > 0
+
+
+def test_candidate_pairs_are_distinct():
+    segments = np.array([[0.0, 0.0, 10.0, 0.0], [5.0, -1.0, 5.0, 1.0], [9.0, -1.0, 9.0, 1.0]])
+    pairs = candidate_pairs(segments)
+
+    assert (pairs[:, 0] < pairs[:, 1]).all()
+    assert len(np.unique(pairs, axis=0)) == len(pairs)
+    assert {(0, 1), (0, 2)} <= set(map(tuple, pairs.tolist()))
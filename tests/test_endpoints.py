@@ -0,0 +1,83 @@
+import numpy as np
+
+from helpers import brute_pairs, linestring
+from modules.endpoints import extend_dangles, neighbour_pairs, snap_endpoints, union_find
+from modules.wkb import wkb_parts
+
+
+def _vertices(buffers):
+    return [wkb_parts(buffer)[0].tolist() for buffer in buffers]
+
+
+def test_neighbour_pairs_match_brute_force():
+    rng = np.random.default_rng(1)
+
+    for count in (2, 10, 500):
+        coordinates = rng.uniform(0, 10, (count, 2))
+        pairs = neighbour_pairs(coordinates, 0.2)
+
+        found = {tuple(sorted(pair)) for pair in pairs.tolist()}
+        assert len(found) == len(pairs)
+        assert found == brute_pairs(coordinates, 0.2)
+
+
+def test_union_find_labels_components_by_smallest_member():
+    pairs = np.array([[4, 1], [1, 3], [5, 6]])
+    assert union_find(pairs, 8).tolist() == [0, 1, 2, 1, 1, 5, 5, 7]
+    assert union_find(np.empty((0, 2), dtype=np.int64), 3).tolist() == [0, 1, 2]
+
+
+def test_ends_are_clustered_and_projected():
+    buffers = [linestring((0, 0), (1, 0)), linestring((1.05, 0.02), (2, 0)), linestring((0.5, 0.08), (0.5, 1)),
+               linestring((5, 5), (6, 6))]
+    snap_endpoints(buffers, 0.1)
+
+    vertices = _vertices(buffers)
+    assert vertices[0][1] == vertices[1][0]
+    np.testing.assert_allclose(vertices[0][1], [1.025, 0.01])
+    # the T junction lands on the moved line, not on its original course
+    (x, y), (end_x, end_y) = vertices[2][0], vertices[0][1]
+    assert abs(x * end_y - y * end_x) < 1e-12
+    assert np.hypot(x - 0.5, y - 0.08) <= 0.1
+    assert vertices[3] == [[5, 5], [6, 6]]
+
+
+def test_snapping_does_not_depend_on_the_order():
+    lines = [((0, 0), (1, 0)), ((1.05, 0.02), (2, 0)), ((0.5, 0.08), (0.5, 1)), ((5, 5), (6, 6))]
+    forward = [linestring(*line) for line in lines]
+    backward = [linestring(*line) for line in reversed(lines)]
+    snap_endpoints(forward, 0.1)
+    snap_endpoints(backward, 0.1)
+
+    assert _vertices(forward) == list(reversed(_vertices(backward)))
+
+
+def test_short_line_does_not_collapse():
+    buffers = [linestring((0, 0), (0.3, 0))]
+    snap_endpoints(buffers, 1.0)
+    assert _vertices(buffers) == [[[0.0, 0.0], [0.3, 0.0]]]
+
+    # both ends within reach of a third end
+    buffers = [linestring((0, 0), (0.3, 0)), linestring((0.15, 0.1), (5, 5))]
+    snap_endpoints(buffers, 1.0)
+    first, last = np.array(_vertices(buffers)[0])
+    assert np.hypot(*(first - last)) > 0
+
+
+def test_chained_ends_move_within_tolerance():
+    starts = [(0.0, 0.0), (0.9, 0.0), (1.8, 0.0), (2.7, 0.0)]
+    buffers = [linestring(start, (start[0], -10.0)) for start in starts]
+    snap_endpoints(buffers, 1.0)
+
+    for start, vertices in zip(starts, _vertices(buffers)):
+        assert np.hypot(vertices[0][0] - start[0], vertices[0][1] - start[1]) <= 1.0
+
+
+def test_only_dangles_are_extended():
+    buffers = [linestring((0, 0), (1, 0)), linestring((1, 0), (2, 0)), linestring((0.5, 0), (0.5, 1)),
+               linestring((5, 5), (6, 5))]
+    changed = extend_dangles(buffers, 0.01, 1e-5)
+
+    assert changed.tolist() == [True, True, True, True]
+    assert _vertices(buffers) == [[[-0.01, 0.0], [1.0, 0.0]], [[1.0, 0.0], [2.01, 0.0]],
+                                  [[0.5, 0.0], [0.5, 1.01]], [[4.99, 5.0], [6.01, 5.0]]]
@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from qgis.core import QgsFeature, QgsField, QgsFields, QgsGeometry, QgsWkbTypes  # noqa: E402
+from qgis.PyQt.QtCore import QVariant  # noqa: E402
+
+from modules.merging import LAYER_FIELD, PATH_FIELD, conform, merge_fields, merge_wkb_type  # noqa: E402
+
+
+def _fields(*fields) -> QgsFields:
+    result = QgsFields()
+    for name, field_type in fields:
+        result.append(QgsField(name, field_type))
+    return result
+
+
+def test_fields_are_merged_by_name():
+    points = _fields(('name', QVariant.String), ('number', QVariant.Int))
+    crossings = _fields(('number', QVariant.Double), ('type', QVariant.String))
+
+    merged = merge_fields(points, crossings)
+
+    assert merged.names() == ['name', 'number', 'type', LAYER_FIELD, PATH_FIELD]
+    # the types differ between the layers
+    assert merged.field('number').type() == QVariant.String
+    assert merged.field('name').type() == QVariant.String
+
+
+def test_wkb_type_holds_every_layer():
+    assert merge_wkb_type(QgsWkbTypes.Point, QgsWkbTypes.Point) == QgsWkbTypes.Point
+    assert merge_wkb_type(QgsWkbTypes.MultiPoint, QgsWkbTypes.Point) == QgsWkbTypes.MultiPoint
+    assert merge_wkb_type(QgsWkbTypes.PointZ, QgsWkbTypes.MultiPoint) == QgsWkbTypes.MultiPointZ
+
+
+def test_features_are_conformed():
+    source = _fields(('number', QVariant.Int), ('type', QVariant.String))
+    merged = merge_fields(_fields(('name', QVariant.String), ('number', QVariant.String)), source)
+
+    features = []
+    for fid, number in ((1, 7), (2, None)):
+        feature = QgsFeature(source, fid)
+        feature.setAttributes([number, 'crossing'])
+        feature.setGeometry(QgsGeometry.fromWkt('Point (1 2)'))
+        features.append(feature)
+
+    result = list(conform(features, source, merged, 'intersections', QgsWkbTypes.MultiPointZ,
+                          path='/data/canals.gpkg'))
+
+    assert [feature.id() for feature in result] == [1, 2]
+    assert result[0].attributes()[1:] == ['7', 'crossing', 'intersections', '/data/canals.gpkg']
+    # NULL (a false QVariant) stays NULL instead of becoming the 'NULL' string
+    assert not result[0]['name']
+    assert not result[1]['number']
+    assert result[1][LAYER_FIELD] == 'intersections'
+    assert result[0].geometry().asWkt() == 'MultiPointZ ((1 2 0))'
@@ -0,0 +1,43 @@
+import numpy as np
+
+from modules.ordering import NO_KEY, hilbert_keys, spatial_order
+
+
+def _reference_key(side: int, x: int, y: int) -> int:
+    key = 0
+    step = side // 2
+    while step > 0:
+        rx = 1 if x & step else 0
+        ry = 1 if y & step else 0
+        key += step * step * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x, y = side - 1 - x, side - 1 - y
+            x, y = y, x
+        step //= 2
+    return key
+
+
+def test_hilbert_keys_match_reference():
+    side = 16
+    points = np.array([[x, y] for x in range(side) for y in range(side)], dtype=float)
+
+    keys = hilbert_keys(points, (0, 0, side - 1, side - 1), order=4)
+
+    assert keys.tolist() == [_reference_key(side, int(x), int(y)) for x, y in points]
+    assert sorted(keys.tolist()) == list(range(side * side))
+
+
+def test_hilbert_keys_of_missing_coordinates():
+    keys = hilbert_keys(np.array([[np.nan, 1.0], [0.0, 0.0], [1.0, 1.0]]))
+
+    assert keys[0] == NO_KEY
+    assert keys[1] < keys[2] < NO_KEY
+    assert (hilbert_keys(np.full((2, 2), np.nan)) == NO_KEY).all()
+
+
+def test_spatial_order_sorts_by_rank_first():
+    points = np.array([[0.0, 0.0], [1.0, 1.0], [0.0, 0.0], [1.0, 1.0]])
+    order = spatial_order(np.array([1, 1, 0, 0]), points)
+
+    assert order.tolist() == [2, 3, 0, 1]
@@ -0,0 +1,91 @@
+import csv
+import json
+import time
+
+from modules.profiling import Profiler, profiled
+
+
+def _slow(count: int, delay: float):
+    for item in range(count):
+        time.sleep(delay)
+        yield item
+
+
+class _Feedback:
+    def __init__(self) -> None:
+        self.messages = []
+
+    def pushInfo(self, info: str) -> None:
+        self.messages.append(info)
+
+
+def test_time_is_charged_to_the_producing_stage():
+    profiler = Profiler()
+
+    with profiler.stage('output') as record:
+        record['features'] = sum(1 for _ in profiled(profiler, 'source', _slow(5, 0.01)))
+
+    source, output = profiler.stages['source'], profiler.stages['output']
+    assert source['features'] == 5
+    assert output['features'] == 5
+    assert source['seconds'] >= 0.05
+    assert output['seconds'] < source['seconds']
+    assert source['peak_rss'] is None or source['peak_rss'] > 0
+
+
+def test_streams_off_leaves_the_features_alone():
+    profiler = Profiler(streams=False)
+    features = _slow(3, 0.0)
+
+    assert profiled(profiler, 'source', features) is features
+    assert profiled(None, 'source', features) is features
+    with profiler.stage('output'):
+        list(features)
+
+    assert list(profiler.stages) == ['output']
+
+
+def test_saved_json_shape(tmp_path):
+    profiler = Profiler()
+    list(profiled(profiler, 'source', range(3)))
+    with profiler.stage('output') as record:
+        record['features'] = 3
+    profiler.group('a', 2, 0.5)
+
+    path = tmp_path / 'profile.json'
+    profiler.save(str(path))
+    saved = json.loads(path.read_text(encoding='utf-8'))
+
+    assert sorted(saved) == ['groups', 'stages']
+    assert [stage['stage'] for stage in saved['stages']] == ['source', 'output']
+    for stage in saved['stages']:
+        assert sorted(stage) == ['features', 'peak_rss', 'seconds', 'stage']
+        assert stage['features'] == 3
+    assert saved['groups'] == [{'group': 'a', 'features': 2, 'seconds': 0.5}]
+
+
+def test_saved_csv_rows(tmp_path):
+    profiler = Profiler()
+    with profiler.stage('output'):
+        pass
+    profiler.group('a', 2, 0.5)
+
+    path = tmp_path / 'profile.csv'
+    profiler.save(str(path))
+    with open(str(path), newline='', encoding='utf-8') as file:
+        rows = list(csv.reader(file))
+
+    assert rows[0] == ['kind', 'name', 'seconds', 'features', 'peak_rss']
+    assert [row[:2] for row in rows[1:]] == [['stage', 'output'], ['group', 'a']]
+
+
+def test_report_lists_the_slowest_groups():
+    profiler = Profiler()
+    for name, seconds in (('a', 0.1), ('b', 0.3), ('c', 0.2)):
+        profiler.group(name, 1, seconds)
+
+    feedback = _Feedback()
+    profiler.report(feedback)
+
+    assert feedback.messages[0] == '3 line name groups snapped in 0.600 s'
+    assert [message.split(':')[0].strip() for message in feedback.messages[1:]] == ['b', 'c', 'a']
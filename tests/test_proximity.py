@@ -0,0 +1,62 @@
+import pytest
+
+from modules.proximity import find_field, proximity
+
+# the defaults of the CANALSFIELD, POINTSFIELD and TYPEFIELD options
+DEFAULT_FIELDS = ('name', 'line', 'type')
+
+SCHEMAS = [
+    ['fid', 'name', 'type', 'uuid'],
+    ['FID', 'Name', 'Type'],
+    ['id', 'NAME', 'TYPE', 'line'],
+    ['id', 'line_name', 'point_type'],
+    ['id', 'canal_name', 'pt_type', 'length'],
+    ['osm_id', 'Line', 'object_type', 'Name_2'],
+    ['id', 'lines', 'types', 'names'],
+    ['id', 'typename', 'name', 'line_id'],
+    ['id', 'line_nm', 'typ'],
+    ['fid', 'Line Name', 'Type Code'],
+    ['objectid', 'shape_length', 'canalname', 'deliverytype'],
+]
+
+
+def _original_proximity(first: str, second: str) -> float:
+    # the matching before the n-gram profiles were capped and cached: every substring is compared
+    first = first.lower().strip()
+    second = second.lower().strip()
+    first_set = {first[i:i + 1 + j] for j in range(len(first)) for i in range(len(first) - j)}
+    second_set = {second[i:i + 1 + j] for j in range(len(second)) for i in range(len(second) - j)}
+    return len(first_set & second_set) / len(first_set | second_set)
+
+
+def _original_find_field(sample_field: str, layer_fields: list) -> str:
+    proximity_list = [_original_proximity(sample_field, field) for field in layer_fields]
+    return layer_fields[proximity_list.index(max(proximity_list))]
+
+
+@pytest.mark.parametrize('layer_fields', SCHEMAS)
+def test_default_fields_resolve_as_before(layer_fields):
+    for sample_field in DEFAULT_FIELDS:
+        assert find_field(sample_field, layer_fields) == _original_find_field(sample_field, layer_fields)
+
+
+def test_exact_and_case_variant_matches():
+    assert find_field('name', ['fid', 'name', 'type']) == 'name'
+    assert find_field('name', ['FID', 'Name', 'Type']) == 'Name'
+    assert find_field('type', ['id', 'NAME', ' TYPE ']) == ' TYPE '
+    # the first of two case variants, like the original maximum search
+    assert find_field('name', ['NAME', 'name']) == 'NAME'
+
+
+def test_fuzzy_matches():
+    assert find_field('name', ['id', 'canal_name', 'pt_type', 'length']) == 'canal_name'
+    assert find_field('line', ['id', 'line_name', 'point_type']) == 'line_name'
+    assert find_field('type', ['osm_id', 'Line', 'object_type', 'Name_2']) == 'object_type'
+    assert find_field('type', ['objectid', 'shape_length', 'canalname', 'deliverytype']) == 'deliverytype'
+
+
+def test_proximity_is_symmetric_and_bounded():
+    assert proximity('name', 'NAME ') == 1.0
+    assert proximity('name', 'uuid') == 0.0
+    assert proximity('line', 'line_name') == proximity('line_name', 'line')
+    assert 0.0 < proximity('line', 'line_name') < 1.0
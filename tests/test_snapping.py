@@ -0,0 +1,69 @@
+import numpy as np
+
+from helpers import brute_nearest, linestring
+from modules import snapping
+from modules.snapping import SegmentGrid, register_segments, snap_coordinates
+
+
+def test_grid_matches_brute_force(monkeypatch):
+    # small batches exercise the batching of the candidate pairs too
+    monkeypatch.setattr(snapping, 'PAIRS_PER_BATCH', 50)
+    rng = np.random.default_rng(1)
+
+    for _ in range(20):
+        segments = rng.random((rng.integers(1, 60), 4)) * 10
+        points = rng.random((300, 2)) * 10
+        tolerance = rng.random() * 1.5
+
+        snapped, found = SegmentGrid(segments, tolerance).snap(points)
+        projected, distance = brute_nearest(points, segments)
+
+        expected = distance <= tolerance ** 2
+        np.testing.assert_array_equal(found, expected)
+        np.testing.assert_allclose(np.hypot(*(snapped - points).T), np.sqrt(np.where(expected, distance, 0)))
+        np.testing.assert_array_equal(snapped[~found], points[~found])
+
+
+def test_nearest_ignores_own_segments():
+    segments = np.array([[0.0, 0.0, 1.0, 0.0], [0.0, 0.5, 1.0, 0.5]])
+    grid = SegmentGrid(segments, 1.0, owners=np.array([0, 1]))
+
+    snapped, found, nearest = grid.nearest(np.array([[0.5, 0.1]]), owners=np.array([0]))
+
+    assert found.tolist() == [True]
+    assert nearest.tolist() == [1]
+    np.testing.assert_allclose(snapped, [[0.5, 0.5]])
+
+
+def test_long_segment_registers_along_its_length():
+    rng = np.random.default_rng(0)
+    starts = rng.random((2000, 2)) * 1000
+    segments = np.vstack((np.hstack((starts, starts + 0.01)), [[0.0, 0.0, 1000.0, 1000.0]]))
+
+    grid = SegmentGrid(segments, 0.001)
+
+    # a bounding box registration would take (1000 / 0.01) ** 2 cells
+    assert len(grid.cell_ids) < 10 ** 6
+    snapped, found, nearest = grid.nearest(np.array([[500.0005, 500.0]]))
+    assert found.tolist() == [True]
+    assert nearest.tolist() == [2000]
+    np.testing.assert_allclose(snapped, [[500.00025, 500.00025]])
+
+
+def test_register_segments_keeps_a_segment_once_per_cell():
+    segments = np.array([[0.0, 0.0, 10.0, 0.0], [0.0, 0.5, 0.5, 0.5]])
+    _, cell_ids, cell_segments = register_segments(segments, np.zeros(2), 1.0, 0.1)
+
+    entries = list(zip(cell_ids.tolist(), cell_segments.tolist()))
+    assert len(entries) == len(set(entries))
+    assert np.all(np.diff(cell_ids) >= 0)
+    assert set(cell_segments.tolist()) == {0, 1}
+
+
+def test_snap_coordinates_leaves_far_points():
+    line = linestring((0, 0), (10, 0))
+    snapped = snap_coordinates([line], np.array([[5.0, 0.2], [5.0, 3.0]]), 0.5)
+
+    np.testing.assert_allclose(snapped, [[5.0, 0.0], [5.0, 3.0]])
+    np.testing.assert_allclose(snap_coordinates([], np.array([[1.0, 1.0]]), 0.5), [[1.0, 1.0]])
+
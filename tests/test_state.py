@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from helpers import Feature, point  # noqa: E402
+from modules.state import StateStore  # noqa: E402
+
+
+def _features():
+    return [Feature(point(0, 0), 'a', 1), Feature(point(0, 0), 'a', 1), Feature(point(5, 5), 'b', 2)]
+
+
+def test_uuids_are_reused_for_unchanged_features(tmp_path):
+    path = str(tmp_path / 'state.sqlite')
+
+    state = StateStore(path)
+    assign = state.uuid_assigner('points')
+    first = [assign(feature) for feature in _features()]
+    state.commit()
+    # identical features still get distinct uuids
+    assert len(set(first)) == 3
+
+    state = StateStore(path)
+    assign = state.uuid_assigner('points')
+    changed = _features()
+    changed[2] = Feature(point(5, 6), 'b', 2)
+    second = [assign(feature) for feature in changed]
+    state.commit()
+
+    assert second[:2] == first[:2]
+    assert second[2] not in first
+
+
+def test_unchanged_groups_are_skipped(tmp_path):
+    path = str(tmp_path / 'state.sqlite')
+
+    state = StateStore(path)
+    for name in ('a', 'b', None):
+        assert state.snapped_group(name, 'digest-' + str(name)) is None
+        state.store_group(name, 'digest-' + str(name), ['u-' + str(name)], [point(1, 1)])
+    state.commit()
+
+    state = StateStore(path)
+    # a is skipped, the inputs of b changed and there are no more NULL names
+    assert state.snapped_group('a', 'digest-a') == {'u-a': point(1, 1)}
+    assert state.snapped_group('b', 'other') is None
+    state.store_group('b', 'other', ['u-b'], [point(2, 2)])
+    state.commit()
+
+    state = StateStore(path)
+    assert state.snapped_group('a', 'digest-a') == {'u-a': point(1, 1)}
+    assert state.snapped_group('b', 'other') == {'u-b': point(2, 2)}
+    assert state.snapped_group(None, 'digest-None') is None
+    state.close()
+
+def test_group_digest_ignores_the_order():
+    lines = [bytes(point(0, 0)), bytes(point(1, 1))]
+    digest = StateStore.group_digest(lines, ['u1', 'u2'], [point(0, 0), point(1, 1)], 0.5)
+
+    assert StateStore.group_digest(lines[::-1], ['u2', 'u1'], [point(1, 1), point(0, 0)], 0.5) == digest
+    assert StateStore.group_digest(lines, ['u1', 'u2'], [point(0, 0), point(1, 1)], 0.6) != digest
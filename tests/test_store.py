@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from qgis.core import QgsFeature, QgsField, QgsFields, QgsGeometry, QgsWkbTypes  # noqa: E402
+from qgis.PyQt.QtCore import QVariant  # noqa: E402
+
+from modules.store import FeatureStore  # noqa: E402
+
+
+def _fields() -> QgsFields:
+    fields = QgsFields()
+    fields.append(QgsField('name', QVariant.String))
+    fields.append(QgsField('uuid', QVariant.String))
+    return fields
+
+
+def _feature(fields: QgsFields, fid: int, wkt, name, uuid) -> QgsFeature:
+    feature = QgsFeature(fields, fid)
+    feature.setAttributes([name, uuid])
+    if wkt is not None:
+        feature.setGeometry(QgsGeometry.fromWkt(wkt))
+    return feature
+
+
+def test_features_round_trip():
+    fields = _fields()
+    features = [_feature(fields, 7, 'PointZ (1 2 3)', 'a', 'u1'),
+                _feature(fields, 8, 'MultiPointZ ((4 5 6),(7 8 9))', 'a', None),
+                _feature(fields, 9, None, 'b', None)]
+    store = FeatureStore(fields, QgsWkbTypes.MultiPointZ)
+    assert list(store.collect(features)) == features
+
+    rebuilt = list(store.sorted_features(store.groups(0, 1)))
+
+    assert len(rebuilt) == 3
+    for original, copy in zip(sorted(features, key=QgsFeature.id), sorted(rebuilt, key=QgsFeature.id)):
+        assert copy.id() == original.id()
+        assert copy.attributes() == original.attributes()
+        assert copy.geometry().asWkt() == original.geometry().asWkt()
+
+
+def test_groups_order():
+    fields = _fields()
+    store = FeatureStore(fields, QgsWkbTypes.Point)
+    for fid, (wkt, name, uuid) in enumerate([('Point (9 9)', 'b', 'u2'), ('Point (0 0)', 'a', 'u9'),
+                                             ('Point (1 1)', 'b', 'u1'), ('Point (0 0)', 'b', 'u3')]):
+        store.append(_feature(fields, fid, wkt, name, uuid))
+
+    groups = store.groups(0, 1)
+    assert [(name, ids.tolist()) for name, ids in groups] == [('a', [1]), ('b', [2, 0, 3])]
+
+    spatial = store.groups(0, 1, spatial=True)
+    assert [(name, ids.tolist()) for name, ids in spatial] == [('a', [1]), ('b', [3, 2, 0])]
+    assert store.values(1, spatial[1][1]) == ['u3', 'u1', 'u2']
+
+
+def test_geometries_take_the_dimensions_of_the_layer():
+    fields = _fields()
+    features = [_feature(fields, 0, 'Point (1 2)', 'a', 'u1'),
+                _feature(fields, 1, 'PointZM (3 4 5 6)', 'a', 'u2'),
+                _feature(fields, 2, 'MultiPoint ((7 8))', 'a', 'u3')]
+
+    flat = FeatureStore(fields, QgsWkbTypes.MultiPoint)
+    raised = FeatureStore(fields, QgsWkbTypes.MultiPointZ)
+    for feature in features:
+        flat.append(feature)
+        raised.append(feature)
+
+    assert flat.coordinates.tolist() == [[1, 2], [3, 4], [7, 8]]
+    assert raised.coordinates.tolist() == [[1, 2, 0], [3, 4, 5], [7, 8, 0]]
+    assert [feature.geometry().asWkt() for feature in flat.features(np.arange(3), flat.wkb(np.arange(3)))] \
+        == ['Point (1 2)', 'Point (3 4)', 'MultiPoint ((7 8))']
+    assert [feature.geometry().asWkt() for feature in raised.features(np.arange(3), raised.wkb(np.arange(3)))] \
+        == ['PointZ (1 2 0)', 'PointZ (3 4 5)', 'MultiPointZ ((7 8 0))']
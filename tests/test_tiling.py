@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from qgis.core import QgsCoordinateTransformContext, QgsFeature, QgsGeometry, QgsVectorLayer  # noqa: E402
+
+from modules.pipeline import build_network, intersection_fields, with_uuid_field  # noqa: E402
+from modules.tiling import SpillStore, process_canal_tiles  # noqa: E402
+
+
+def _lines() -> QgsVectorLayer:
+    # a line starting in the first tile and crossing into the second one, and
+    # a line lying on the seam: they cross on the seam
+    layer = QgsVectorLayer('LineString?crs=EPSG:3857&field=name:string', 'canals', 'memory')
+    features = []
+    for name, wkt in (('a', 'LineString (0 5, 15 5)'), ('b', 'LineString (10 0, 10 9)')):
+        feature = QgsFeature(layer.fields())
+        feature.setAttributes([name])
+        feature.setGeometry(QgsGeometry.fromWkt(wkt))
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def _assign(feature: QgsFeature) -> str:
+    return 'uuid-{}'.format(feature['name'])
+
+
+def _signature(features):
+    # the sinks may store the pieces as multi-part geometries
+    signature = []
+    for feature in features:
+        geometry = QgsGeometry(feature.geometry())
+        geometry.convertToMultiType()
+        signature.append((feature['uuid'], geometry.asWkt(6)))
+    return sorted(signature)
+
+
+def test_tiles_stitch_without_duplicates_or_gaps(qgis_application, tmp_path):
+    source = _lines()
+    fields = with_uuid_field(source.fields())
+    crossing_fields = intersection_fields(fields, 'name', 'type')
+
+    sink = QgsVectorLayer('MultiLineString?crs=EPSG:3857', 'pieces', 'memory')
+    sink.dataProvider().addAttributes(fields.toList())
+    sink.updateFields()
+
+    spill = SpillStore(str(tmp_path), QgsCoordinateTransformContext())
+    process_canal_tiles(source, fields, 10.0, 1.0, 0.01, spill, sink.dataProvider(), crossing_fields,
+                        'name', 'type', 'crossing', 100, _assign)
+
+    network = build_network(source.getFeatures(), fields, 0.01, assign=_assign)
+    expected_pieces = _signature(network.split())
+    expected_crossings = _signature(network.intersections(crossing_fields, 'name', 'type', 'crossing'))
+
+    # every piece once, from the tile owning the first vertex of its line
+    assert len(expected_pieces) == 4
+    assert _signature(sink.getFeatures()) == expected_pieces
+    assert _signature(spill.layer('canals').getFeatures()) == expected_pieces
+
+    # the crossing on the seam once, from the tile owning uuid-a
+    crossings = list(spill.layer('intersections').getFeatures())
+    assert _signature(crossings) == expected_crossings
+    assert len(crossings) == 1
+    assert crossings[0].geometry().asWkt(6) == 'Point (10 5)'
+
+    directory = spill.directory
+    spill.remove()
+    assert not os.path.exists(directory)
@@ -0,0 +1,52 @@
+import numpy as np
+
+from helpers import Feature, linestring, point
+from modules.topology import TopologyBuilder
+
+
+def _network() -> TopologyBuilder:
+    builder = TopologyBuilder(0, 1, 0, 1, tolerance=0.5, node_distance=0.01)
+    list(builder.lines([Feature(linestring((0, 0), (1, 0), (3, 0)), 'a', 'l0'),
+                        Feature(linestring((3, 0), (3, 4)), 'a', 'l1'),
+                        Feature(linestring((3.001, 0), (6, 0)), 'b', 'l2')]))
+    list(builder.points([Feature(point(2, 0.1), 'a', 'p0'),
+                         Feature(point(3.1, 2), 'a', 'p1'),
+                         Feature(point(1, 0.05), 'b', 'p2'),
+                         Feature(point(0, 0), None, 'p3')]))
+    return builder
+
+
+def test_csr_graph():
+    graph = _network().build()
+
+    np.testing.assert_allclose(graph['node_xy'], [[0, 0], [3, 0], [3, 4], [6, 0]])
+    assert graph['edge_nodes'].tolist() == [[0, 1], [1, 2], [1, 3]]
+    np.testing.assert_allclose(graph['edge_length'], [3, 4, 2.999])
+    assert graph['edge_name'].tolist() == [0, 0, 1]
+    assert graph['edge_uuid'].tolist() == ['l0', 'l1', 'l2']
+    assert graph['names'].tolist() == ['a', 'b']
+
+    assert graph['csr_indptr'].tolist() == [0, 1, 4, 5, 6]
+    assert graph['csr_nodes'].tolist() == [1, 2, 3, 0, 1, 1]
+    assert graph['csr_edges'].tolist() == [0, 1, 2, 0, 1, 2]
+
+
+def test_points_attach_to_the_lines_of_their_name():
+    graph = _network().build()
+
+    assert graph['point_uuid'].tolist() == ['p0', 'p1', 'p2', 'p3']
+    assert graph['point_name'].tolist() == [0, 0, 1, -1]
+    # p2 is close to l0 only, which has another name
+    assert graph['point_edge'].tolist() == [0, 1, -1, -1]
+    np.testing.assert_allclose(graph['point_measure'], [2, 2, np.nan, np.nan])
+
+
+def test_save_writes_plain_npy_files(tmp_path):
+    builder = _network()
+    builder.save(str(tmp_path))
+
+    graph = builder.build()
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted('{}.npy'.format(name) for name in graph)
+    for name, array in graph.items():
+        loaded = np.load(str(tmp_path / '{}.npy'.format(name)), mmap_mode='r', allow_pickle=False)
+        np.testing.assert_array_equal(loaded, array)
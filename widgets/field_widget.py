@@ -1,4 +1,5 @@
-from typing import Union
+from collections import OrderedDict
+from typing import Any, Union
 
 from processing.gui.wrappers import (
     TableFieldWidgetWrapper
@@ -14,9 +15,38 @@ DIALOG_STANDARD = QgsProcessingGui.Standard
 DIALOG_BATCH = QgsProcessingGui.Batch
 DIALOG_MODELER = QgsProcessingGui.Modeler
 
+# file based parent layers kept loaded per wrapper
+MAX_PARENT_LAYERS = 8
+
+
+class LayerCache(OrderedDict):
+    """
+    Layers loaded from file paths, the least recently used one being
+    dropped once more than ``size`` are kept.
+    """
+
+    def __init__(self, size: int) -> None:
+        super().__init__()
+        self.size = size
+
+    def __getitem__(self, key: Any) -> Any:
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.size:
+            self.popitem(last=False)
+
 
 class CustomFieldWrapper(TableFieldWidgetWrapper):
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parent_file_based_layers = LayerCache(MAX_PARENT_LAYERS)
+
     def parentValueChanged(self, wrapper):
         value = wrapper.parameterValue()
         if isinstance(value, str) and value in self.parent_file_based_layers:
@@ -30,13 +60,14 @@ class CustomFieldWrapper(TableFieldWidgetWrapper):
 
         if self._layer and self.parameterDefinition().defaultValue():
             default_value = self.parameterDefinition().defaultValue()
+            layer_fields = self._layer.fields().names()
             if isinstance(default_value, (list, set, tuple, dict)):
                 for defautl_field in default_value:
-                    outfield = find_field(defautl_field, self._layer.fields().names())
+                    outfield = find_field(defautl_field, layer_fields)
                     out_fields.append(outfield)
 
             elif isinstance(default_value, str):
-                outfield = find_field(default_value, self._layer.fields().names())
+                outfield = find_field(default_value, layer_fields)
                 out_fields = outfield
         else:
             out_fields = self.parameterDefinition().defaultValue()